@@ -1,6 +1,8 @@
 from flask import Flask
 from flask_cors import CORS
+from config import Config
 from routes.routes_init import register_routes  # Import register_routes function
+from services.scheduler import snapshot_scheduler
 
 app = Flask(__name__)
 
@@ -9,6 +11,10 @@ CORS(app)
 # Register the routes via blueprints
 register_routes(app)
 
+# Keep the saved Meta snapshots warm in the background
+if Config.SNAPSHOT_SCHEDULER_ENABLED:
+    snapshot_scheduler.start()
+
 @app.route('/', methods=['GET'])
 def home():
     return "Welcome to the homepage! Go to /facebook to see Facebook data."
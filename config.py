@@ -8,4 +8,82 @@ class Config:
     PAGE_ID = os.getenv("PAGE_ID", "your_default_page_id")
     INSTAGRAM_PAGE_ID = os.getenv("INSTAGRAM_PAGE_ID", "your_default_instagram_page_id")
     AD_ACCOUNT_ID = os.getenv('AD_ACCOUNT_ID', 'act_402130546896771')  # Replace with your actual Ad Account ID
-   
\ No newline at end of file
+
+    # Graph API client settings (shared by every controller)
+    GRAPH_API_VERSION = os.getenv("GRAPH_API_VERSION", "v19.0")
+    GRAPH_POOL_SIZE = int(os.getenv("GRAPH_POOL_SIZE", "10"))  # Keep-alive connections to graph.facebook.com
+    GRAPH_CONNECT_TIMEOUT = float(os.getenv("GRAPH_CONNECT_TIMEOUT", "5"))  # Seconds
+    GRAPH_READ_TIMEOUT = float(os.getenv("GRAPH_READ_TIMEOUT", "60"))  # Seconds
+    GRAPH_MAX_WORKERS = int(os.getenv("GRAPH_MAX_WORKERS", "8"))  # Concurrent Graph calls per refresh
+
+    # Adaptive throttling from the X-App-Usage / X-Ad-Account-Usage / X-Business-Use-Case-Usage headers
+    GRAPH_USAGE_SLOWDOWN_PCT = float(os.getenv("GRAPH_USAGE_SLOWDOWN_PCT", "75"))  # Halve concurrency above this usage
+    GRAPH_USAGE_PAUSE_PCT = float(os.getenv("GRAPH_USAGE_PAUSE_PCT", "90"))  # Pause all calls above this usage
+    GRAPH_THROTTLE_PAUSE = float(os.getenv("GRAPH_THROTTLE_PAUSE", "60"))  # Seconds to pause when Graph gives no regain time
+    GRAPH_MAX_PAUSE = float(os.getenv("GRAPH_MAX_PAUSE", "300"))  # Upper bound on any single pause
+
+    # Retries and circuit breaking for Graph calls
+    GRAPH_CALL_DEADLINE = float(os.getenv("GRAPH_CALL_DEADLINE", "120"))  # Seconds per call, across all retries
+    GRAPH_RETRY_ATTEMPTS = int(os.getenv("GRAPH_RETRY_ATTEMPTS", "4"))  # Total attempts for transient/throttled calls
+    GRAPH_RETRY_BASE_DELAY = float(os.getenv("GRAPH_RETRY_BASE_DELAY", "0.5"))  # Seconds, doubled per retry
+    GRAPH_RETRY_MAX_DELAY = float(os.getenv("GRAPH_RETRY_MAX_DELAY", "30"))  # Backoff cap in seconds
+    GRAPH_BREAKER_THRESHOLD = int(os.getenv("GRAPH_BREAKER_THRESHOLD", "5"))  # Consecutive failures that open a breaker
+    GRAPH_BREAKER_COOLDOWN = float(os.getenv("GRAPH_BREAKER_COOLDOWN", "30"))  # Seconds before a half-open probe
+
+    # On-disk Graph response cache (GET only, access tokens stripped from keys)
+    GRAPH_CACHE_ENABLED = os.getenv("GRAPH_CACHE_ENABLED", "1") == "1"
+    GRAPH_CACHE_PATH = os.getenv("GRAPH_CACHE_PATH", "graph_cache.sqlite3")
+    GRAPH_CACHE_MAX_BYTES = int(os.getenv("GRAPH_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+    GRAPH_CACHE_TTLS = {  # Seconds per endpoint; endpoints not listed here are never cached
+        "ads": int(os.getenv("GRAPH_CACHE_TTL_ADS", "600")),
+        "insights": int(os.getenv("GRAPH_CACHE_TTL_INSIGHTS", "300")),
+    }
+    GRAPH_CACHE_TTL_CAMPAIGN = int(os.getenv("GRAPH_CACHE_TTL_CAMPAIGN", "3600"))  # Campaign metadata lookups
+
+    # Insights fetch mode for the ad refresh endpoints ("sequential", "concurrent", "batch" or "account")
+    ADS_FETCH_MODE = os.getenv("ADS_FETCH_MODE", "sequential")
+    # "full" re-downloads insights on every refresh; "incremental" syncs daily rows from a per-ad watermark
+    INSIGHTS_SYNC = os.getenv("INSIGHTS_SYNC", "full")
+    INSIGHTS_ATTRIBUTION_WINDOW_DAYS = int(os.getenv("INSIGHTS_ATTRIBUTION_WINDOW_DAYS", "7"))  # Trailing days re-fetched
+    BREAKDOWN_CACHE_TTL = int(os.getenv("BREAKDOWN_CACHE_TTL", "900"))  # Seconds to reuse account breakdown insights
+    BREAKDOWN_SHARDING = os.getenv("BREAKDOWN_SHARDING", "0") == "1"  # Split date_preset=maximum into parallel time_range shards
+    BREAKDOWN_SHARD_MONTHS = int(os.getenv("BREAKDOWN_SHARD_MONTHS", "1"))  # Months per shard
+
+    # Async insights report runs, used automatically for accounts with at least this many ads (0 disables)
+    ASYNC_INSIGHTS_AD_THRESHOLD = int(os.getenv("ASYNC_INSIGHTS_AD_THRESHOLD", "1000"))
+    ASYNC_REPORT_POLL_INTERVAL = float(os.getenv("ASYNC_REPORT_POLL_INTERVAL", "2"))  # First poll delay in seconds
+    ASYNC_REPORT_POLL_MAX_INTERVAL = float(os.getenv("ASYNC_REPORT_POLL_MAX_INTERVAL", "30"))  # Backoff cap in seconds
+    ASYNC_REPORT_TIMEOUT = float(os.getenv("ASYNC_REPORT_TIMEOUT", "900"))  # Give up on a report run after this many seconds
+
+    # Page Access Token cache used by /facebook
+    PAGE_TOKEN_TTL = int(os.getenv("PAGE_TOKEN_TTL", "86400"))  # Re-check the token at least this often (seconds)
+    PAGE_TOKEN_REFRESH_MARGIN = int(os.getenv("PAGE_TOKEN_REFRESH_MARGIN", "600"))  # Refresh this long before expiry
+
+    # Most recent posts returned by /instagram (Graph's default page size; the full media history is never walked)
+    INSTAGRAM_MEDIA_LIMIT = int(os.getenv("INSTAGRAM_MEDIA_LIMIT", "25"))
+
+    # File where IDs resolved from Graph (e.g. the Instagram business account) are persisted across restarts
+    RESOLVED_IDS_PATH = os.getenv("RESOLVED_IDS_PATH", "resolved_ids.json")
+
+    # Directory for the lock/result files that coalesce concurrent snapshot refreshes across workers
+    REFRESH_LOCK_DIR = os.getenv("REFRESH_LOCK_DIR", "refresh_locks")
+
+    # Background refresh jobs (POST /jobs/refresh/<snapshot>)
+    REFRESH_JOB_WORKERS = int(os.getenv("REFRESH_JOB_WORKERS", "2"))  # Snapshots refreshed at the same time
+    REFRESH_JOB_RETENTION = int(os.getenv("REFRESH_JOB_RETENTION", "3600"))  # Seconds a finished job stays queryable
+
+    # Scheduler that refreshes the saved snapshots before they go stale (interval 0 disables a snapshot)
+    SNAPSHOT_SCHEDULER_ENABLED = os.getenv("SNAPSHOT_SCHEDULER_ENABLED", "0") == "1"
+    SNAPSHOT_REFRESH_INTERVALS = {  # Maximum snapshot age in seconds
+        "meta_ads": int(os.getenv("SNAPSHOT_REFRESH_INTERVAL_META_ADS", "1800")),
+        "meta_ads2": int(os.getenv("SNAPSHOT_REFRESH_INTERVAL_META_ADS2", "1800")),
+        "meta_ads3": int(os.getenv("SNAPSHOT_REFRESH_INTERVAL_META_ADS3", "1800")),
+        "meta_ads4": int(os.getenv("SNAPSHOT_REFRESH_INTERVAL_META_ADS4", "1800")),
+    }
+    SNAPSHOT_REFRESH_JITTER = float(os.getenv("SNAPSHOT_REFRESH_JITTER", "0.1"))  # Refresh up to this fraction of the interval early
+    SNAPSHOT_RETRY_INTERVAL = int(os.getenv("SNAPSHOT_RETRY_INTERVAL", "300"))  # Seconds before retrying a failed refresh
+
+    # SQLite store of the refreshed snapshots behind the /ads query endpoints
+    INSIGHTS_STORE_ENABLED = os.getenv("INSIGHTS_STORE_ENABLED", "1") == "1"
+    INSIGHTS_STORE_PATH = os.getenv("INSIGHTS_STORE_PATH", "insights.sqlite3")
+    INSIGHTS_STORE_DEFAULT_SNAPSHOT = os.getenv("INSIGHTS_STORE_DEFAULT_SNAPSHOT", "meta_ads2")  # Queried when ?snapshot= is not given
@@ -1,10 +1,16 @@
 import os
-import json
 import requests
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from config import Config  # Ensure Config has PAGE_ACCESS_TOKEN and AD_ACCOUNT_ID
+from services.single_flight import refresh_flight, refresh_key
+from services.jobs import refresh_jobs
+from services.snapshots import write_snapshot, send_snapshot, query_saved_snapshot
+from services.snapshot_index import is_snapshot_query
+from services.insights_store import store_snapshot
+from services.meta_ads import fetch_ads, refresh_ads_insights, check_refresh_options, InvalidOptionError, fetch_breakdown_insights, use_async_reports, group_by_platform
 
 JSON_FILE_PATH = "meta_ads2.json"
+SNAPSHOT_NAME = os.path.splitext(JSON_FILE_PATH)[0]  # Snapshot name used by /jobs/refresh/<snapshot>
 
 ads_reports_blueprint = Blueprint('ads-Report', __name__)
 
@@ -24,131 +30,114 @@ breakdown_fields = "age,gender,device_platform,region"
 
 @ads_reports_blueprint.route('/ads-Report', methods=['GET'])
 def fetch_all_campaign_insights():
+    """Fetches every ad with its insights and breakdowns and saves them to the JSON file (concurrent callers share one refresh; ?background=1 runs it as a job)."""
+    options = request.args.to_dict()
+    background = options.pop("background", None)
+    try:
+        check_refresh_options(options)
+    except InvalidOptionError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if background:
+        # Run the refresh as a background job instead; poll GET /jobs/<id> for its progress
+        job = refresh_jobs.submit(SNAPSHOT_NAME, run_refresh, options)
+        return jsonify(job.summary()), 202
+
+    body, status_code = run_refresh(options)
+    return jsonify(body), status_code
+
+
+def run_refresh(options):
+    """Runs refresh_snapshot, coalescing it with any refresh of this snapshot already running in another thread or worker."""
+    key = refresh_key(JSON_FILE_PATH, Config.AD_ACCOUNT_ID)
+    return refresh_flight.run(key, lambda: refresh_snapshot(options))
+
+
+def refresh_snapshot(options):
+    """Fetches the ads, their insights and the breakdowns and saves them to the JSON file; returns (body, status_code)."""
     try:
         ad_account_id = Config.AD_ACCOUNT_ID
         access_token = Config.PAGE_ACCESS_TOKEN
 
-        # Step 1: Fetch all ads
-        ads_url = f"https://graph.facebook.com/v18.0/{ad_account_id}/ads"
-        ads_params = {
-            "fields": "id,name,adset_id,campaign_id,status",
-            "access_token": access_token
-        }
-        ads_response = requests.get(ads_url, params=ads_params)
-
-        if not ads_response.ok:
-            return jsonify({"error": "Failed to fetch Ads", "details": ads_response.text}), ads_response.status_code
+        # Step 1: Fetch all ads (every page)
+        try:
+            ads_data = fetch_ads(ad_account_id, access_token)
+        except requests.exceptions.HTTPError as e:
+            return {"error": "Failed to fetch Ads", "details": e.response.text}, e.response.status_code
 
-        ads_data = ads_response.json().get('data', [])
         if not ads_data:
-            return jsonify({"error": "No ads found"}), 404
-
-        campaign_ads_data = []
-
-        # Step 2: Fetch insights for each ad
-        for ad in ads_data:
-            ad_id = ad.get("id")
-            insights_url = f"https://graph.facebook.com/v18.0/{ad_id}/insights"
-            insights_params = {
-    "fields": "account_id,account_name,ad_id,ad_name,adset_id,adset_name,"
-              "campaign_id,campaign_name,clicks,cpc,cpm,cpp,ctr,"
-              "date_start,date_stop,engagement_rate_ranking,frequency,"
-              "impressions,inline_link_clicks,inline_post_engagement,objective,"
-              "quality_ranking,reach,social_spend,spend,"
-              "unique_clicks,unique_ctr,"
-              "video_p100_watched_actions,video_p25_watched_actions,"
-              "video_p50_watched_actions,video_p75_watched_actions,video_p95_watched_actions",
-    "breakdowns": "publisher_platform",  # Breakdown by platform (Facebook, Instagram, Audience Network)
-    "access_token": access_token
-}
-
-            insights_response = requests.get(insights_url, params=insights_params)
-
-            if insights_response.ok:
-                insights_data = insights_response.json().get('data', [])
-                if insights_data:
-                    ad["insights"] = insights_data
-                    # Debugging: Print all the available fields in the insights data
-                    print(f"Insight Data for Ad ID: {ad_id}")
-                    for insight in insights_data:
-                        for key, value in insight.items():
-                            print(f"{key}: {value}")  # Print each key-value pair in insights
-
-                    # Process the insights data to format it with platforms (Facebook, Instagram, Audience Network)
-                    platform_data = {}
-                    for insight in insights_data:
-                        platform = insight.get('publisher_platform', 'unknown')  # Default to 'unknown' if platform is missing or null
-                        print(f"Platform for Ad ID {ad_id}: {platform}")  # Debug print for platform
-                        if platform not in platform_data:
-                            platform_data[platform] = []
-                        platform_data[platform].append(insight)
-
-                    ad["insights_by_platform"] = platform_data
-                else:
-                    ad["insights"] = "No insights available"
-            else:
-                ad["insights"] = f"Failed to fetch insights: {insights_response.text}"
-
-            # Fetch additional breakdown insights (Age, Region, Gender, Device)
-            breakdown_insights = fetch_breakdown_insights(ad_account_id, access_token)
-            ad["breakdown_insights"] = breakdown_insights  # Add breakdown data to ad insights
-
-            campaign_ads_data.append(ad)
-
-
-        # Step 4: Save data to JSON
-        with open(JSON_FILE_PATH, "w") as json_file:
-            json.dump({"ads_data": campaign_ads_data}, json_file, indent=4)
-
-        return jsonify({"message": "Meta Ads data saved successfully"}), 200
+            return {"error": "No ads found"}, 404
+
+        # Step 2: Fetch insights for each ad (full or incremental sync, in the requested fetch mode)
+        campaign_ads_data, sync_state = refresh_ads_insights(
+            ad_account_id,
+            ads_data,
+            ad_insights_params(access_token),
+            apply_ad_insights,
+            options,
+            JSON_FILE_PATH,
+        )
+
+        # Step 3: Fetch account breakdown insights once per refresh (Age, Region, Gender, Device)
+        breakdown_insights = fetch_breakdown_insights(
+            ad_account_id, access_token, async_report=use_async_reports(len(ads_data))
+        )
+
+        # Step 4: Save data to JSON (compact, atomically replaced)
+        snapshot = {"ads_data": campaign_ads_data, "breakdown_insights": breakdown_insights}
+        if sync_state:
+            snapshot["sync_state"] = sync_state
+        write_snapshot(JSON_FILE_PATH, snapshot)
+        store_snapshot(SNAPSHOT_NAME, snapshot)  # Also index it for the /ads query endpoints
+
+        return {"message": "Meta Ads data saved successfully"}, 200
 
     except Exception as e:
-        return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
+        return {"error": "Internal Server Error", "details": str(e)}, 500
 
 
 @ads_reports_blueprint.route('/saved-meta-ads2', methods=['GET'])
 def get_saved_meta_ads():
-    """Returns saved Meta Ads data from the JSON file."""
-    if not os.path.exists(JSON_FILE_PATH):
+    """Returns saved Meta Ads data from the JSON file (whole file sent as-is, or a page/projection/filter of it)."""
+    if is_snapshot_query(request.args):
+        # limit/cursor/fields/filters are answered from the in-memory snapshot index
+        body, status_code = query_saved_snapshot(JSON_FILE_PATH, request.args)
+        return jsonify(body), status_code
+
+    response = send_snapshot(JSON_FILE_PATH)
+    if response is None:
         return jsonify({"error": "No saved data found"}), 404
 
-    with open(JSON_FILE_PATH, "r") as json_file:
-        data = json.load(json_file)
+    return response
 
-    return jsonify(data), 200
 
-
-def fetch_breakdown_insights(ad_account_id, access_token):
-    """Fetch insights separately for Age, Region, Gender, and Device Platform with pagination."""
-    BASE_URL = f"https://graph.facebook.com/v18.0/{ad_account_id}/insights"
-    COMMON_PARAMS = {
-        'access_token': access_token,
-        'fields': 'reach,impressions,clicks',
-        'date_preset': 'maximum',
+def ad_insights_params(access_token):
+    """Builds the insights query params for an ad with a publisher platform split."""
+    insights_params = {
+        "fields": ",".join(insight_fields),
+        "breakdowns": "publisher_platform",  # Breakdown by platform (Facebook, Instagram, Audience Network)
+        "access_token": access_token
     }
-
-    BREAKDOWNS = ['age', 'region', 'gender', 'device_platform']
-    breakdown_data = {}
-
-    for breakdown in BREAKDOWNS:
-        params = COMMON_PARAMS.copy()
-        params['breakdowns'] = breakdown
-
-        all_data = []
-        while True:
-            response = requests.get(BASE_URL, params=params)
-            data = response.json()
-
-            if 'data' in data:
-                all_data.extend(data['data'])
-            else:
-                breakdown_data[breakdown] = {"error": "No data or error in response"}
-                break
-
-            if 'paging' in data and 'next' in data['paging']:
-                params['after'] = data['paging']['cursors']['after']
-            else:
-                breakdown_data[breakdown] = all_data
-                break
-
-    return breakdown_data
+    return insights_params
+
+
+def apply_ad_insights(ad, insights_response):
+    """Stores an ad's insights response as insights / insights_by_platform, or as an error string."""
+    ad_id = ad.get("id")
+
+    if insights_response.ok:
+        insights_data = insights_response.json().get('data', [])
+        if insights_data:
+            ad["insights"] = insights_data
+            # Debugging: Print all the available fields in the insights data
+            print(f"Insight Data for Ad ID: {ad_id}")
+            for insight in insights_data:
+                for key, value in insight.items():
+                    print(f"{key}: {value}")  # Print each key-value pair in insights
+
+            # Process the insights data to format it with platforms (Facebook, Instagram, Audience Network)
+            ad["insights_by_platform"] = group_by_platform(insights_data)
+        else:
+            ad["insights"] = "No insights available"
+    else:
+        ad["insights"] = f"Failed to fetch insights: {insights_response.text}"
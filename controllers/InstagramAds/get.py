@@ -1,10 +1,16 @@
 import os
-import json
 import requests
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from config import Config  # Ensure Config has PAGE_ACCESS_TOKEN and AD_ACCOUNT_ID
+from services.single_flight import refresh_flight, refresh_key
+from services.jobs import refresh_jobs
+from services.snapshots import write_snapshot, send_snapshot, query_saved_snapshot
+from services.snapshot_index import is_snapshot_query
+from services.insights_store import store_snapshot
+from services.meta_ads import fetch_ads, refresh_ads_insights, check_refresh_options, InvalidOptionError, fetch_breakdown_insights, use_async_reports
 
 JSON_FILE_PATH = "meta_ads3.json"
+SNAPSHOT_NAME = os.path.splitext(JSON_FILE_PATH)[0]  # Snapshot name used by /jobs/refresh/<snapshot>
 
 insta_ads_blueprint = Blueprint('insta-ads', __name__)
 
@@ -25,108 +31,101 @@ breakdown_fields = "age,gender,device_platform,region"
 
 @insta_ads_blueprint.route('/insta-ads', methods=['GET'])
 def fetch_all_campaign_insights():
+    """Fetches every ad with its insights and breakdowns and saves them to the JSON file (concurrent callers share one refresh; ?background=1 runs it as a job)."""
+    options = request.args.to_dict()
+    background = options.pop("background", None)
     try:
-        ad_account_id = Config.AD_ACCOUNT_ID
-        access_token = Config.PAGE_ACCESS_TOKEN
+        check_refresh_options(options)
+    except InvalidOptionError as e:
+        return jsonify({"error": str(e)}), 400
 
-        # Step 1: Fetch all ads
-        ads_url = f"https://graph.facebook.com/v18.0/{ad_account_id}/ads"
-        ads_params = {
-            "fields": "id,name,adset_id,campaign_id,status",
-            "access_token": access_token
-        }
-        ads_response = requests.get(ads_url, params=ads_params)
+    if background:
+        # Run the refresh as a background job instead; poll GET /jobs/<id> for its progress
+        job = refresh_jobs.submit(SNAPSHOT_NAME, run_refresh, options)
+        return jsonify(job.summary()), 202
 
-        if not ads_response.ok:
-            return jsonify({"error": "Failed to fetch Ads", "details": ads_response.text}), ads_response.status_code
-
-        ads_data = ads_response.json().get('data', [])
-        if not ads_data:
-            return jsonify({"error": "No ads found"}), 404
+    body, status_code = run_refresh(options)
+    return jsonify(body), status_code
 
-        campaign_ads_data = []
 
-        # Step 2: Fetch insights for each ad, filtering for Instagram platform only
-        for ad in ads_data:
-            ad_id = ad.get("id")
-            insights_url = f"https://graph.facebook.com/v18.0/{ad_id}/insights"
-            insights_params = {
-                "fields": ",".join(insight_fields),
-                "breakdowns": breakdown_fields,
-                "publisher_platform": "instagram",
-                "access_token": access_token
-            }
+def run_refresh(options):
+    """Runs refresh_snapshot, coalescing it with any refresh of this snapshot already running in another thread or worker."""
+    key = refresh_key(JSON_FILE_PATH, Config.AD_ACCOUNT_ID)
+    return refresh_flight.run(key, lambda: refresh_snapshot(options))
 
-            insights_response = requests.get(insights_url, params=insights_params)
 
-            if insights_response.ok:
-                insights_data = insights_response.json().get('data', [])
-                ad["insights"] = insights_data if insights_data else "No insights available"
-            else:
-                ad["insights"] = f"Failed to fetch insights: {insights_response.text}"
-
-            # Step 3: Fetch breakdown insights only for Instagram (age, region, gender, device)
-            breakdown_insights = fetch_breakdown_insights(ad_account_id, access_token)
-            ad["breakdown_insights"] = breakdown_insights
-
-            campaign_ads_data.append(ad)
+def refresh_snapshot(options):
+    """Fetches the ads, their insights and the breakdowns and saves them to the JSON file; returns (body, status_code)."""
+    try:
+        ad_account_id = Config.AD_ACCOUNT_ID
+        access_token = Config.PAGE_ACCESS_TOKEN
 
-        # Step 4: Save data to JSON
-        with open(JSON_FILE_PATH, "w") as json_file:
-            json.dump({"ads_data": campaign_ads_data}, json_file, indent=4)
+        # Step 1: Fetch all ads (every page)
+        try:
+            ads_data = fetch_ads(ad_account_id, access_token)
+        except requests.exceptions.HTTPError as e:
+            return {"error": "Failed to fetch Ads", "details": e.response.text}, e.response.status_code
 
-        return jsonify({"message": "Meta Ads data saved successfully"}), 200
+        if not ads_data:
+            return {"error": "No ads found"}, 404
+
+        # Step 2: Fetch insights for each ad, filtering for Instagram platform only (full or incremental sync)
+        campaign_ads_data, sync_state = refresh_ads_insights(
+            ad_account_id,
+            ads_data,
+            ad_insights_params(access_token),
+            apply_ad_insights,
+            options,
+            JSON_FILE_PATH,
+        )
+
+        # Step 3: Fetch account breakdown insights once per refresh, only for Instagram (age, region, gender, device)
+        breakdown_insights = fetch_breakdown_insights(
+            ad_account_id, access_token, publisher_platform="instagram", async_report=use_async_reports(len(ads_data))
+        )
+
+        # Step 4: Save data to JSON (compact, atomically replaced)
+        snapshot = {"ads_data": campaign_ads_data, "breakdown_insights": breakdown_insights}
+        if sync_state:
+            snapshot["sync_state"] = sync_state
+        write_snapshot(JSON_FILE_PATH, snapshot)
+        store_snapshot(SNAPSHOT_NAME, snapshot)  # Also index it for the /ads query endpoints
+
+        return {"message": "Meta Ads data saved successfully"}, 200
 
     except Exception as e:
-        return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
+        return {"error": "Internal Server Error", "details": str(e)}, 500
 
 @insta_ads_blueprint.route('/saved-meta-ads3', methods=['GET'])
 def get_saved_meta_ads():
-    """Returns saved Meta Ads data from the JSON file."""
-    if not os.path.exists(JSON_FILE_PATH):
+    """Returns saved Meta Ads data from the JSON file (whole file sent as-is, or a page/projection/filter of it)."""
+    if is_snapshot_query(request.args):
+        # limit/cursor/fields/filters are answered from the in-memory snapshot index
+        body, status_code = query_saved_snapshot(JSON_FILE_PATH, request.args)
+        return jsonify(body), status_code
+
+    response = send_snapshot(JSON_FILE_PATH)
+    if response is None:
         return jsonify({"error": "No saved data found"}), 404
-    
-    with open(JSON_FILE_PATH, "r") as json_file:
-        data = json.load(json_file)
-    return jsonify(data), 200
-def fetch_breakdown_insights(ad_account_id, access_token):
-    """Fetch breakdown insights for Instagram (Age, Region, Gender, Device Platform) manually filtering results."""
-    BASE_URL = f"https://graph.facebook.com/v18.0/{ad_account_id}/insights"
-
-    COMMON_PARAMS = {
-        'access_token': access_token,
-        'fields': 'reach,impressions,clicks',
-        'date_preset': 'maximum',
+
+    return response
+
+
+def ad_insights_params(access_token):
+    """Builds the insights query params for an ad, restricted to the Instagram platform."""
+    insights_params = {
+        "fields": ",".join(insight_fields),
+        "breakdowns": breakdown_fields,
+        "publisher_platform": "instagram",
+        "access_token": access_token
     }
+    return insights_params
+
 
-    BREAKDOWNS = ['age', 'region', 'gender', 'device_platform']
-    breakdown_data = {}
-
-    for breakdown in BREAKDOWNS:
-        params = COMMON_PARAMS.copy()
-        params['breakdowns'] = breakdown
-
-        all_data = []
-        while True:
-            response = requests.get(BASE_URL, params=params)
-            if not response.ok:
-                breakdown_data[breakdown] = {"error": response.text}
-                break
-
-            data = response.json()
-            if 'data' in data:
-                # Filter to include only Instagram data
-                instagram_data = [entry for entry in data['data'] if entry.get("publisher_platform") == "instagram"]
-                all_data.extend(instagram_data)
-            else:
-                breakdown_data[breakdown] = {"error": "No data available"}
-                break
-
-            # Handle pagination
-            if 'paging' in data and 'next' in data['paging']:
-                params['after'] = data['paging']['cursors']['after']
-            else:
-                breakdown_data[breakdown] = all_data
-                break
-
-    return breakdown_data
+def apply_ad_insights(ad, insights_response):
+    """Stores an ad's insights response on the ad, or an error string if the request failed."""
+    if insights_response.ok:
+        insights_data = insights_response.json().get('data', [])
+        ad["insights"] = insights_data if insights_data else "No insights available"
+    else:
+        ad["insights"] = f"Failed to fetch insights: {insights_response.text}"
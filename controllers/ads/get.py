@@ -0,0 +1,84 @@
+import os
+from flask import Blueprint, jsonify, request
+from config import Config  # Ensure Config has the INSIGHTS_STORE_* settings
+from controllers.jobs.get import SNAPSHOT_CONTROLLERS
+from services.insights_store import insights_store, store_snapshot
+from services.pagination import PaginationError, encode_cursor, decode_cursor, parse_limit, parse_fields
+from services.snapshots import load_snapshot
+
+ads_blueprint = Blueprint('ads', __name__)
+
+# Snapshot name -> the JSON file its refresh writes
+SNAPSHOT_PATHS = {controller.SNAPSHOT_NAME: controller.JSON_FILE_PATH for controller in SNAPSHOT_CONTROLLERS}
+
+@ads_blueprint.route('/ads/<ad_id>', methods=['GET'])
+def get_ad(ad_id):
+    """Returns one ad from the insights store with its insights rows and platform splits (?snapshot=, ?fields=, ?platform=, ?since=, ?until=)."""
+    snapshot, error = resolve_snapshot()
+    if error:
+        return error
+
+    ad = insights_store.get_ad(
+        snapshot, ad_id, platform=request.args.get("platform"), since=request.args.get("since"), until=request.args.get("until")
+    )
+    if ad is None:
+        return jsonify({"error": f"Ad {ad_id} not found in {snapshot}"}), 404
+
+    return jsonify(project_insights(ad, parse_fields(request.args.get("fields")))), 200
+
+
+@ads_blueprint.route('/ads', methods=['GET'])
+def list_ads():
+    """Lists ads from the insights store filtered by campaign/ad set/platform/date, one cursor page at a time."""
+    snapshot, error = resolve_snapshot()
+    if error:
+        return error
+
+    try:
+        limit = parse_limit(request.args.get("limit"))
+        after = decode_cursor(request.args.get("cursor"))
+        if after is not None and not isinstance(after, str):
+            raise PaginationError("Invalid cursor")
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+
+    ads, last_ad_id = insights_store.query_ads(
+        snapshot,
+        campaign_id=request.args.get("campaign_id"),
+        adset_id=request.args.get("adset_id"),
+        platform=request.args.get("platform"),
+        since=request.args.get("since"),
+        until=request.args.get("until"),
+        limit=limit,
+        after=after,
+    )
+
+    fields = parse_fields(request.args.get("fields"))
+    return jsonify({
+        "snapshot": snapshot,
+        "data": [project_insights(ad, fields) for ad in ads],
+        "paging": {"next_cursor": encode_cursor(last_ad_id) if last_ad_id else None},
+    }), 200
+
+
+def resolve_snapshot():
+    """Returns (snapshot, None) for ?snapshot= (loading an existing snapshot file into the store once), or (None, error response)."""
+    if insights_store is None:
+        return None, (jsonify({"error": "The insights store is disabled"}), 503)
+
+    snapshot = request.args.get("snapshot", Config.INSIGHTS_STORE_DEFAULT_SNAPSHOT)
+    if snapshot not in SNAPSHOT_PATHS:
+        return None, (jsonify({"error": f"Unknown snapshot '{snapshot}'", "snapshots": sorted(SNAPSHOT_PATHS)}), 404)
+
+    # Snapshots saved before the store existed are imported on first use; refreshes keep them current
+    if not insights_store.has_snapshot(snapshot) and os.path.exists(SNAPSHOT_PATHS[snapshot]):
+        store_snapshot(snapshot, load_snapshot(SNAPSHOT_PATHS[snapshot]))
+
+    return snapshot, None
+
+
+def project_insights(ad, fields):
+    """Keeps only the requested fields of each insights row (ad-level fields are always returned)."""
+    if fields and isinstance(ad.get("insights"), list):
+        ad["insights"] = [{field: row[field] for field in fields if field in row} for row in ad["insights"]]
+    return ad
@@ -1,40 +1,66 @@
 import requests
 import json
-from flask import Blueprint, jsonify
+from itertools import islice
+from flask import Blueprint, jsonify, request
 from config import Config  # Ensure Config contains PAGE_ID and ACCESS_TOKEN
+from services.graph_api import graph_get, graph_batch, iter_items, MAX_PAGE_LIMITS
+from services.resilience import graph_error, is_token_error
+from services.resolved_ids import get_instagram_business_account_id, invalidate_instagram_business_account, ResolveError
 
 instagram_blueprint = Blueprint('instagram', __name__)
 
+MEDIA_FIELDS = "id,caption, shares_count,comments_count, like_count,media_type,media_url,thumbnail_url,timestamp,permalink,children{id,media_type,media_url,thumbnail_url}"
+POST_INSIGHT_METRICS = "engagement,like_count,comments,reactions,shares"
+
+# Graph error code for an object that does not exist (or is no longer reachable with this token)
+UNKNOWN_OBJECT_CODE = 100
+
 @instagram_blueprint.route('/instagram', methods=['GET'])
 def get_instagram_data():
     try:
-        # Step 1: Get Instagram Business Account ID
-        facebook_url = f"https://graph.facebook.com/v19.0/{Config.PAGE_ID}?fields=instagram_business_account&access_token={Config.PAGE_ACCESS_TOKEN}"
-        response = requests.get(facebook_url)
-
-        if not response.ok:
-            return jsonify({"error": "Failed to fetch Instagram Business Account", "details": response.text}), response.status_code
-
-        data = response.json()
-        instagram_business_account_id = data.get('instagram_business_account', {}).get('id')
-
-        if not instagram_business_account_id:
-            return jsonify({"error": "Instagram Business Account not found"}), 404
-
-        # Step 2: Get Instagram Posts
-        instagram_url = f"https://graph.facebook.com/v19.0/{instagram_business_account_id}/media"
+        # Step 1: Get Instagram Business Account ID (resolved once, then served from the ID cache)
+        if request.args.get("refresh_account"):
+            invalidate_instagram_business_account()
+
+        try:
+            instagram_business_account_id = get_instagram_business_account_id()
+        except ResolveError as e:
+            if e.details is None:
+                return jsonify({"error": str(e)}), e.status_code
+            return jsonify({"error": str(e), "details": e.details}), e.status_code
+
+        # Step 2: Get Instagram Posts with their engagement insights expanded inline
+        instagram_url = f"{instagram_business_account_id}/media"
         params = {
-            "fields": "id,caption, shares_count,comments_count, like_count,media_type,media_url,thumbnail_url,timestamp,permalink,children{id,media_type,media_url,thumbnail_url}",
+            "fields": f"{MEDIA_FIELDS},insights.metric({POST_INSIGHT_METRICS})",
+            "limit": min(Config.INSTAGRAM_MEDIA_LIMIT, MAX_PAGE_LIMITS["media"]),
             "access_token": Config.PAGE_ACCESS_TOKEN
         }
 
-        instagram_response = requests.get(instagram_url, params=params)
-
-        if not instagram_response.ok:
-            return jsonify({"error": "Failed to fetch Instagram posts", "details": instagram_response.text}), instagram_response.status_code
-
-        instagram_data = instagram_response.json()
-        posts = instagram_data.get('data', [])
+        try:
+            posts = list_recent_media(instagram_url, params)
+        except requests.exceptions.HTTPError:
+            # Some metrics cannot be expanded for every media type; list the posts without them instead
+            params["fields"] = MEDIA_FIELDS
+            try:
+                posts = list_recent_media(instagram_url, params)
+            except requests.exceptions.HTTPError as e:
+                # The cached account may have been unlinked from the Page; throttling and 5xx say nothing about it
+                if is_token_error(e.response) or graph_error(e.response).get("code") == UNKNOWN_OBJECT_CODE:
+                    invalidate_instagram_business_account()
+                return jsonify({"error": "Failed to fetch Instagram posts", "details": e.response.text}), e.response.status_code
+
+        # Fetch insights for any post the listing could not expand them for, in Batch API requests
+        missing_insights = [post for post in posts if "insights" not in post]
+        if missing_insights:
+            engagement_params = {"metric": POST_INSIGHT_METRICS, "access_token": Config.PAGE_ACCESS_TOKEN}
+            engagement_responses = graph_batch(
+                [(f"{post['id']}/insights", engagement_params) for post in missing_insights],
+                Config.PAGE_ACCESS_TOKEN
+            )
+            for post, engagement_response in zip(missing_insights, engagement_responses):
+                if engagement_response.ok:
+                    post["insights"] = engagement_response.json()
 
         # Step 3: Process Instagram Posts
         post_details = []
@@ -55,17 +81,10 @@ def get_instagram_data():
                 "thumbnail_url": post.get("thumbnail_url") if media_type == "VIDEO" else None
             }
 
-            # Fetch engagement metrics for each post
-            engagement_url = f"https://graph.facebook.com/v19.0/{post['id']}/insights"
-            engagement_params = {
-                "metric": "engagement,like_count,comments,reactions,shares",
-                "access_token": Config.PAGE_ACCESS_TOKEN
-            }
-
-            engagement_response = requests.get(engagement_url, params=engagement_params)
+            # Engagement metrics for each post (expanded inline or fetched in a batch above)
+            engagement_data = post.get("insights", {}).get("data")
 
-            if engagement_response.ok:
-                engagement_data = engagement_response.json().get("data", [])
+            if engagement_data is not None:
                 engagement_metrics = {item["name"]: item["values"][0]["value"] for item in engagement_data}
 
                 post_data.update({
@@ -94,14 +113,14 @@ def get_instagram_data():
             post_details.append(post_data)
 
         # Step 4: Get Instagram Insights (Followers, Reach)
-        insights_url = f"https://graph.facebook.com/v19.0/{instagram_business_account_id}/insights"
+        insights_url = f"{instagram_business_account_id}/insights"
         insights_params = {
             "metric": "follower_count,reach",
             "period": "day",
             "access_token": Config.PAGE_ACCESS_TOKEN
         }
 
-        insights_response = requests.get(insights_url, params=insights_params)
+        insights_response = graph_get(insights_url, params=insights_params)
 
         if not insights_response.ok:
             return jsonify({"error": "Failed to fetch Instagram insights", "details": insights_response.text}), insights_response.status_code
@@ -120,3 +139,9 @@ def get_instagram_data():
         return jsonify({"error": "Request error", "details": str(e)}), 500
     except Exception as e:
         return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
+
+
+def list_recent_media(instagram_url, params):
+    """Returns the account's INSTAGRAM_MEDIA_LIMIT most recent posts, reading only the pages needed for them."""
+    # No prefetch: a page past the limit would be requested and thrown away
+    return list(islice(iter_items(instagram_url, params=params, prefetch=False), Config.INSTAGRAM_MEDIA_LIMIT))
@@ -0,0 +1,61 @@
+from flask import Blueprint, jsonify, request
+from config import Config  # Ensure Config has SNAPSHOT_REFRESH_INTERVALS
+from controllers.metaAds import get as meta_ads
+from controllers.metaAds import get2 as meta_ads4
+from controllers.AdsReport import get as ads_report
+from controllers.InstagramAds import get as insta_ads
+from services.jobs import refresh_jobs
+from services.meta_ads import check_refresh_options, InvalidOptionError
+from services.scheduler import snapshot_scheduler
+
+jobs_blueprint = Blueprint('jobs', __name__)
+
+SNAPSHOT_CONTROLLERS = (meta_ads, ads_report, insta_ads, meta_ads4)
+
+# Snapshot name -> the controller refresh that writes it
+SNAPSHOT_REFRESHES = {controller.SNAPSHOT_NAME: controller.run_refresh for controller in SNAPSHOT_CONTROLLERS}
+
+for controller in SNAPSHOT_CONTROLLERS:
+    snapshot_scheduler.add(
+        controller.SNAPSHOT_NAME,
+        controller.JSON_FILE_PATH,
+        controller.run_refresh,
+        Config.SNAPSHOT_REFRESH_INTERVALS.get(controller.SNAPSHOT_NAME, 0),
+    )
+
+@jobs_blueprint.route('/jobs/refresh/<snapshot>', methods=['POST'])
+def start_refresh_job(snapshot):
+    """Queues a background refresh of a saved snapshot and returns its job id (query/JSON options are passed on)."""
+    refresh = SNAPSHOT_REFRESHES.get(snapshot)
+    if refresh is None:
+        return jsonify({"error": f"Unknown snapshot '{snapshot}'", "snapshots": sorted(SNAPSHOT_REFRESHES)}), 404
+
+    body = request.get_json(silent=True)
+    if body is not None and not isinstance(body, dict):
+        return jsonify({"error": "The JSON body must be an object of refresh options"}), 400
+
+    options = request.args.to_dict()
+    options.update(body or {})
+    try:
+        check_refresh_options(options)
+    except InvalidOptionError as e:
+        return jsonify({"error": str(e)}), 400
+
+    job = refresh_jobs.submit(snapshot, refresh, options)
+    return jsonify(job.summary()), 202
+
+
+@jobs_blueprint.route('/jobs/schedule', methods=['GET'])
+def get_schedule():
+    """Returns the snapshot scheduler's state: intervals, running jobs and the last success/failure per snapshot."""
+    return jsonify({"enabled": Config.SNAPSHOT_SCHEDULER_ENABLED, "snapshots": snapshot_scheduler.status()}), 200
+
+
+@jobs_blueprint.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Returns a refresh job's status, progress (ads done/total, API calls, elapsed time) and final result."""
+    job = refresh_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(job.as_dict()), 200
@@ -1,143 +1,131 @@
 import os
-import json
 import requests
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from config import Config  # Ensure Config has PAGE_ACCESS_TOKEN and AD_ACCOUNT_ID
+from services.single_flight import refresh_flight, refresh_key
+from services.jobs import refresh_jobs
+from services.snapshots import write_snapshot, send_snapshot, query_saved_snapshot
+from services.snapshot_index import is_snapshot_query
+from services.insights_store import store_snapshot
+from services.meta_ads import fetch_ads, refresh_ads_insights, check_refresh_options, InvalidOptionError, fetch_breakdown_insights, use_async_reports, group_by_platform
 
 JSON_FILE_PATH = "meta_ads.json"
+SNAPSHOT_NAME = os.path.splitext(JSON_FILE_PATH)[0]  # Snapshot name used by /jobs/refresh/<snapshot>
 
 meta_ads_blueprint = Blueprint('meta_ads', __name__)
 
 @meta_ads_blueprint.route('/meta-ads', methods=['GET'])
 def get_meta_ads_data():
-    """Fetches Facebook Ads and Instagram Ads data using Ad Account ID and saves it to a JSON file."""
+    """Fetches Facebook Ads and Instagram Ads data using Ad Account ID and saves it to a JSON file (concurrent callers share one refresh; ?background=1 runs it as a job)."""
+    options = request.args.to_dict()
+    background = options.pop("background", None)
     try:
-        ad_account_id = Config.AD_ACCOUNT_ID  # Use the ad account ID from your config file
-        access_token = Config.PAGE_ACCESS_TOKEN  # Your Page Access Token
+        check_refresh_options(options)
+    except InvalidOptionError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if background:
+        # Run the refresh as a background job instead; poll GET /jobs/<id> for its progress
+        job = refresh_jobs.submit(SNAPSHOT_NAME, run_refresh, options)
+        return jsonify(job.summary()), 202
+
+    body, status_code = run_refresh(options)
+    return jsonify(body), status_code
+
+
+def run_refresh(options):
+    """Runs refresh_snapshot, coalescing it with any refresh of this snapshot already running in another thread or worker."""
+    key = refresh_key(JSON_FILE_PATH, Config.AD_ACCOUNT_ID)
+    return refresh_flight.run(key, lambda: refresh_snapshot(options))
 
-        # Step 1: Fetch ads data from the Ad Account
-        ads_url = f"https://graph.facebook.com/v18.0/{ad_account_id}/ads"
-        ads_params = {
-            "fields": "id,name,adset_id,campaign_id,status",  # Basic ad fields
-            "access_token": access_token
-        }
 
-        ads_response = requests.get(ads_url, params=ads_params)
+def refresh_snapshot(options):
+    """Fetches the ads, their insights and the breakdowns and saves them to the JSON file; returns (body, status_code)."""
+    try:
+        ad_account_id = Config.AD_ACCOUNT_ID  # Use the ad account ID from your config file
+        access_token = Config.PAGE_ACCESS_TOKEN  # Your Page Access Token
 
-        if not ads_response.ok:
-            return jsonify({"error": "Failed to fetch Ads", "details": ads_response.text}), ads_response.status_code
+        # Step 1: Fetch ads data from the Ad Account (every page)
+        try:
+            ads_data = fetch_ads(ad_account_id, access_token)
+        except requests.exceptions.HTTPError as e:
+            return {"error": "Failed to fetch Ads", "details": e.response.text}, e.response.status_code
 
-        ads_data = ads_response.json().get('data', [])
         if not ads_data:
-            return jsonify({"error": "No ads found in the Ad Account"}), 404
-
-        campaign_ads_data = []
-
-        for ad in ads_data:
-            ad_id = ad.get("id")
-
-            # Step 2: Fetch insights for each ad with valid fields and platform breakdown
-            insights_url = f"https://graph.facebook.com/v18.0/{ad_id}/insights"
-            insights_params = {
-                "fields": "campaign_name,reach,impressions,spend,clicks,frequency,cpm,cpc,ctr",  # Basic insights fields
-                "breakdown": "publisher_platform",  # Breakdown by platform (Facebook, Instagram, Audience Network)
-                "access_token": access_token
-            }
-
-            insights_response = requests.get(insights_url, params=insights_params)
-
-            if insights_response.ok:
-                insights_data = insights_response.json().get('data', [])
-                if insights_data:
-                    ad["insights"] = insights_data
-                    # Debugging: Print all the available fields in the insights data
-                    print(f"Insight Data for Ad ID: {ad_id}")
-                    for insight in insights_data:
-                        for key, value in insight.items():
-                            print(f"{key}: {value}")  # Print each key-value pair in insights
-
-                    # Process the insights data to format it with platforms (Facebook, Instagram, Audience Network)
-                    platform_data = {}
-                    for insight in insights_data:
-                        platform = insight.get('publisher_platform', 'unknown')  # Default to 'unknown' if platform is missing or null
-                        print(f"Platform for Ad ID {ad_id}: {platform}")  # Debug print for platform
-                        if platform not in platform_data:
-                            platform_data[platform] = []
-                        platform_data[platform].append(insight)
-
-                    ad["insights_by_platform"] = platform_data
-                else:
-                    ad["insights"] = "No insights available"
-            else:
-                ad["insights"] = f"Failed to fetch insights: {insights_response.text}"
-
-            # Fetch additional breakdown insights (Age, Region, Gender, Device)
-            breakdown_insights = fetch_breakdown_insights(ad_account_id, access_token)
-            ad["breakdown_insights"] = breakdown_insights  # Add breakdown data to ad insights
-
-            campaign_ads_data.append(ad)
-
-            
-
-        # Save data to JSON file
-        with open(JSON_FILE_PATH, "w") as json_file:
-            json.dump({"ads_data": campaign_ads_data}, json_file, indent=4)
-
-        return jsonify({"message": "Meta Ads data saved successfully"}), 200
+            return {"error": "No ads found in the Ad Account"}, 404
+
+        # Step 2: Fetch insights for each ad (full or incremental sync, in the requested fetch mode)
+        campaign_ads_data, sync_state = refresh_ads_insights(
+            ad_account_id,
+            ads_data,
+            ad_insights_params(access_token),
+            apply_ad_insights,
+            options,
+            JSON_FILE_PATH,
+        )
+
+        # Fetch account breakdown insights once per refresh (Age, Region, Gender, Device)
+        breakdown_insights = fetch_breakdown_insights(
+            ad_account_id, access_token, async_report=use_async_reports(len(ads_data))
+        )
+
+        # Save data to JSON file (compact, atomically replaced)
+        snapshot = {"ads_data": campaign_ads_data, "breakdown_insights": breakdown_insights}
+        if sync_state:
+            snapshot["sync_state"] = sync_state
+        write_snapshot(JSON_FILE_PATH, snapshot)
+        store_snapshot(SNAPSHOT_NAME, snapshot)  # Also index it for the /ads query endpoints
+
+        return {"message": "Meta Ads data saved successfully"}, 200
 
     except Exception as e:
-        return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
+        return {"error": "Internal Server Error", "details": str(e)}, 500
 
 
 @meta_ads_blueprint.route('/saved-meta-ads', methods=['GET'])
 def get_saved_meta_ads():
-    """Returns saved Meta Ads data from the JSON file."""
+    """Returns saved Meta Ads data from the JSON file (whole file sent as-is, or a page/projection/filter of it)."""
     print("Frontend requested saved Meta Ads data")  # Debugging statement
 
-    if not os.path.exists(JSON_FILE_PATH):
-        return jsonify({"error": "No saved data found"}), 404
+    if is_snapshot_query(request.args):
+        # limit/cursor/fields/filters are answered from the in-memory snapshot index
+        body, status_code = query_saved_snapshot(JSON_FILE_PATH, request.args)
+        return jsonify(body), status_code
 
-    with open(JSON_FILE_PATH, "r") as json_file:
-        data = json.load(json_file)
+    response = send_snapshot(JSON_FILE_PATH)
+    if response is None:
+        return jsonify({"error": "No saved data found"}), 404
 
-    return jsonify(data), 200
+    return response
 
 
-def fetch_breakdown_insights(ad_account_id, access_token):
-    """Fetch insights separately for Age, Region, Gender, and Device Platform with pagination."""
-    BASE_URL = f"https://graph.facebook.com/v15.0/{ad_account_id}/insights"
-    
-    COMMON_PARAMS = {
-        'access_token': access_token,
-        'fields': 'reach,impressions,clicks',  # Fetching only required fields
-        'date_preset': 'maximum',  # Fetch maximum available data
+def ad_insights_params(access_token):
+    """Builds the insights query params for an ad with valid fields and platform breakdown."""
+    insights_params = {
+        "fields": "campaign_name,reach,impressions,spend,clicks,frequency,cpm,cpc,ctr",  # Basic insights fields
+        "breakdown": "publisher_platform",  # Breakdown by platform (Facebook, Instagram, Audience Network)
+        "access_token": access_token
     }
-
-    BREAKDOWNS = ['age', 'region', 'gender', 'device_platform']
-    breakdown_data = {}
-
-    for breakdown in BREAKDOWNS:
-        params = COMMON_PARAMS.copy()
-        params['breakdowns'] = breakdown  # Set the specific breakdown
-        
-        all_data = []  # To store all the paginated results
-        while True:
-            response = requests.get(BASE_URL, params=params)
-            data = response.json()
-
-            if 'data' in data:
-                all_data.extend(data['data'])  # Append current page data to all_data
-            else:
-                breakdown_data[breakdown] = {"error": "No data or error in response"}
-                break
-
-            # Check if there's a next page of data
-            if 'paging' in data and 'next' in data['paging']:
-                # There is another page, update the params to request the next page
-                params['after'] = data['paging']['cursors']['after']
-            else:
-                # No more pages
-                breakdown_data[breakdown] = all_data
-                break
-
-    return breakdown_data
+    return insights_params
+
+
+def apply_ad_insights(ad, insights_response):
+    """Stores an ad's insights response as insights / insights_by_platform, or as an error string."""
+    ad_id = ad.get("id")
+
+    if insights_response.ok:
+        insights_data = insights_response.json().get('data', [])
+        if insights_data:
+            ad["insights"] = insights_data
+            # Debugging: Print all the available fields in the insights data
+            print(f"Insight Data for Ad ID: {ad_id}")
+            for insight in insights_data:
+                for key, value in insight.items():
+                    print(f"{key}: {value}")  # Print each key-value pair in insights
+
+            # Process the insights data to format it with platforms (Facebook, Instagram, Audience Network)
+            ad["insights_by_platform"] = group_by_platform(insights_data)
+        else:
+            ad["insights"] = "No insights available"
+    else:
+        ad["insights"] = f"Failed to fetch insights: {insights_response.text}"
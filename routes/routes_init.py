@@ -4,6 +4,8 @@ from controllers.metaAds.get import meta_ads_blueprint  # Import Meta Ads Bluepr
 from controllers.AdsReport.get import ads_reports_blueprint 
 from controllers.InstagramAds.get import insta_ads_blueprint 
 from controllers.GoogleAds.get import google_ads_blueprint
+from controllers.jobs.get import jobs_blueprint  # Background snapshot refresh jobs
+from controllers.ads.get import ads_blueprint  # Queries over the SQLite insights store
 
 def register_routes(app):
     app.register_blueprint(facebook_blueprint)  # Register Facebook Blueprint
@@ -12,3 +14,5 @@ def register_routes(app):
     app.register_blueprint(ads_reports_blueprint)
     app.register_blueprint(insta_ads_blueprint)  
     app.register_blueprint(google_ads_blueprint)  # Register Meta Ads Blueprint
+    app.register_blueprint(jobs_blueprint)
+    app.register_blueprint(ads_blueprint)
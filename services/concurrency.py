@@ -0,0 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor
+from config import Config  # Ensure Config has GRAPH_MAX_WORKERS and GRAPH_POOL_SIZE
+from services.progress import in_context
+
+
+def resolve_max_workers(requested=None):
+    """Clamps a requested worker count to [1, GRAPH_POOL_SIZE], falling back to GRAPH_MAX_WORKERS."""
+    try:
+        workers = int(requested) if requested is not None else Config.GRAPH_MAX_WORKERS
+    except (TypeError, ValueError):
+        workers = Config.GRAPH_MAX_WORKERS
+    return max(1, min(workers, Config.GRAPH_POOL_SIZE))
+
+
+def bounded_map(func, items, max_workers=None):
+    """Runs func over items on a bounded thread pool and returns the results in input order."""
+    items = list(items)
+    workers = min(resolve_max_workers(max_workers), len(items)) if items else 1
+    if workers <= 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="graph-fanout") as executor:
+        return list(executor.map(in_context(func), items))
+
+
+def run_parallel(*calls):
+    """Runs independent zero-argument callables concurrently and returns their results in argument order."""
+    return bounded_map(lambda call: call(), calls, max_workers=len(calls))
@@ -0,0 +1,290 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlparse, parse_qs
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config  # Ensure Config has GRAPH_API_VERSION and the pool/timeout settings
+from services.rate_limit import usage_scheduler
+from services import resilience
+from services.http_cache import GraphResponseCache, cache_key
+from services.progress import in_context, record_api_call
+
+GRAPH_HOST = "https://graph.facebook.com"
+GRAPH_BASE_URL = f"{GRAPH_HOST}/{Config.GRAPH_API_VERSION}"
+
+# Graph Batch API accepts at most 50 relative requests per POST
+BATCH_LIMIT = 50
+
+# Largest page size each list edge accepts; iter_pages asks for it so lists take as few round trips as possible
+MAX_PAGE_LIMITS = {
+    "ads": 500,
+    "insights": 500,
+    "published_posts": 100,
+    "videos": 100,
+    "media": 100,
+}
+
+# (connect, read) timeout applied to every Graph call unless the caller overrides it
+DEFAULT_TIMEOUT = (Config.GRAPH_CONNECT_TIMEOUT, Config.GRAPH_READ_TIMEOUT)
+
+_session = None
+_session_lock = threading.Lock()
+
+# On-disk cache of GET responses for the endpoints listed in Config.GRAPH_CACHE_TTLS
+response_cache = GraphResponseCache(Config.GRAPH_CACHE_PATH, Config.GRAPH_CACHE_MAX_BYTES) if Config.GRAPH_CACHE_ENABLED else None
+
+# Callbacks run with the access token of any call Graph rejects as unauthorized (expired/invalid token)
+_auth_error_handlers = []
+
+# Background workers that request the next page of a paginated edge while the caller handles the current one
+_prefetch_executor = ThreadPoolExecutor(max_workers=Config.GRAPH_POOL_SIZE, thread_name_prefix="graph-prefetch")
+
+
+def get_session():
+    """Returns the process-wide keep-alive session used for every Graph API call."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,  # We only ever talk to graph.facebook.com
+                    pool_maxsize=Config.GRAPH_POOL_SIZE,
+                    pool_block=True,  # Wait for a free connection instead of opening throwaway ones
+                )
+                session.mount("https://", adapter)
+                session.headers.update({
+                    "Accept-Encoding": "gzip, deflate",
+                    "Connection": "keep-alive",
+                })
+                _session = session
+    return _session
+
+
+def graph_url(path):
+    """Builds a versioned Graph API URL; absolute URLs (e.g. paging 'next' links) are returned unchanged."""
+    if path.startswith("http://") or path.startswith("https://"):
+        return path
+    return f"{GRAPH_BASE_URL}/{path.lstrip('/')}"
+
+
+def on_auth_error(handler):
+    """Registers handler(access_token, response) to be called for every auth-class Graph error; usable as a decorator."""
+    _auth_error_handlers.append(handler)
+    return handler
+
+
+def _request_token(url, params, data):
+    """Returns the access token a request was sent with, from its params, form data or URL query."""
+    for source in (params, data):
+        if isinstance(source, dict) and source.get("access_token"):
+            return source["access_token"]
+    return parse_qs(urlparse(url).query).get("access_token", [None])[0]
+
+
+def graph_request(method, path, params=None, data=None, timeout=None, cache_ttl=None, idempotent=None):
+    """
+    Sends a request to the Graph API, serving GETs from the response cache when possible.
+
+    GET responses are cached for cache_ttl seconds, or the endpoint's entry in Config.GRAPH_CACHE_TTLS
+    when cache_ttl is None (endpoints not listed there are never cached; cache_ttl=0 disables caching).
+    Expired entries are revalidated with If-None-Match, so unchanged objects come back as 304s.
+    idempotent (default: GET only) allows resending the request after Graph may already have run it.
+    """
+    if idempotent is None:
+        idempotent = method == "GET"
+    url = graph_url(path)
+    if cache_ttl is None:
+        cache_ttl = Config.GRAPH_CACHE_TTLS.get(resilience.endpoint_key(url), 0)
+    if response_cache is None or method != "GET" or cache_ttl <= 0:
+        return _send(method, url, params=params, data=data, timeout=timeout, idempotent=idempotent)
+
+    key = cache_key(url, params)
+    cached = response_cache.get(key)
+    headers = None
+    if cached is not None:
+        cached_response, is_fresh, etag = cached
+        if is_fresh:
+            return cached_response
+        if etag:
+            headers = {"If-None-Match": etag}
+
+    response = _send(method, url, params=params, timeout=timeout, headers=headers, idempotent=idempotent)
+
+    if response.status_code == 304 and cached is not None:
+        response_cache.touch(key, cache_ttl)
+        return cached_response
+    if response.status_code == 200:
+        response_cache.store(key, response, cache_ttl)
+    return response
+
+
+def _send(method, url, params=None, data=None, timeout=None, headers=None, idempotent=True):
+    """
+    Sends one logical request through the shared session and returns the raw response.
+
+    Transient failures (5xx, connection errors, timeouts, Graph transient codes) and throttling
+    responses are retried with jittered exponential backoff until GRAPH_RETRY_ATTEMPTS or the
+    per-call GRAPH_CALL_DEADLINE is reached; auth and other client errors are returned at once.
+    A non-idempotent request (e.g. a POST creating an async report run) is only resent when it never
+    reached Graph or Graph throttled it; after a read timeout or 5xx it may already have run.
+    Each endpoint has a circuit breaker that raises CircuitOpenError while Graph keeps failing.
+    Auth errors are reported to the handlers registered with on_auth_error (e.g. token caches).
+    """
+    endpoint = resilience.endpoint_key(url)
+    breaker = resilience.get_breaker(endpoint)
+    timeout = timeout or DEFAULT_TIMEOUT
+    connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    deadline = time.monotonic() + Config.GRAPH_CALL_DEADLINE
+    attempt = 0
+
+    while True:
+        if not breaker.allow():
+            raise resilience.CircuitOpenError(f"Graph endpoint '{endpoint}' is unavailable, failing fast")
+
+        remaining = deadline - time.monotonic()
+        try:
+            # The usage scheduler throttles our concurrency from the usage headers Graph sends back
+            with usage_scheduler.slot():
+                record_api_call()
+                response = get_session().request(
+                    method,
+                    url,
+                    params=params,
+                    data=data,
+                    headers=headers,
+                    timeout=(connect_timeout, max(1.0, min(read_timeout, remaining))),
+                )
+        except requests.exceptions.RequestException as e:
+            if not resilience.is_retryable_exception(e):
+                breaker.release()
+                raise
+            breaker.record_failure()
+            if not idempotent and not resilience.is_unsent_exception(e):
+                raise
+            delay = resilience.backoff_delay(attempt)
+            attempt += 1
+            if attempt >= Config.GRAPH_RETRY_ATTEMPTS or time.monotonic() + delay >= deadline:
+                raise
+            time.sleep(delay)
+            continue
+
+        usage_scheduler.record(response.headers)
+        outcome = resilience.classify_response(response)
+
+        if outcome == resilience.TRANSIENT:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+        if outcome == resilience.AUTH:
+            access_token = _request_token(url, params, data)
+            for handler in _auth_error_handlers:
+                handler(access_token, response)
+
+        if outcome != resilience.THROTTLED and (outcome != resilience.TRANSIENT or not idempotent):
+            return response
+
+        delay = resilience.backoff_delay(attempt)
+        attempt += 1
+        if attempt >= Config.GRAPH_RETRY_ATTEMPTS or time.monotonic() + delay >= deadline:
+            return response
+        if outcome == resilience.THROTTLED:
+            usage_scheduler.pause(delay)  # Hold back every other caller too while Graph is throttling us
+        time.sleep(delay)
+
+
+def graph_get(path, params=None, timeout=None, cache_ttl=None):
+    """GET a Graph API path (or absolute paging URL) through the shared session and response cache."""
+    return graph_request("GET", path, params=params, timeout=timeout, cache_ttl=cache_ttl)
+
+
+def graph_post(path, data=None, params=None, timeout=None, idempotent=False):
+    """POST to a Graph API path through the shared session (resent after a timeout or 5xx only if idempotent)."""
+    return graph_request("POST", path, params=params, data=data, timeout=timeout, idempotent=idempotent)
+
+
+def iter_pages(path, params=None, prefetch=True):
+    """
+    Yields each parsed page of a paginated Graph edge, following paging.next until the last page.
+
+    Each page body is parsed exactly once, and the edge's largest page size (MAX_PAGE_LIMITS) is
+    requested unless params already set a limit. With prefetch enabled the request for page N+1 is
+    sent as soon as its link is known, so it is in flight while the caller handles page N.
+    Raises requests.exceptions.HTTPError (with .response) on a failed page.
+    """
+    params = dict(params or {})
+    max_limit = MAX_PAGE_LIMITS.get(resilience.endpoint_key(graph_url(path)))
+    if max_limit and "limit" not in params:
+        params["limit"] = max_limit
+
+    response = graph_get(path, params=params)
+    while True:
+        if not response.ok:
+            raise requests.exceptions.HTTPError(response.text, response=response)
+
+        page = response.json()
+        next_url = page.get("paging", {}).get("next")  # The 'next' link already carries every query parameter
+        next_page = _prefetch_executor.submit(in_context(graph_get), next_url) if next_url and prefetch else None
+
+        yield page
+
+        if not next_url:
+            return
+        response = next_page.result() if next_page is not None else graph_get(next_url)
+
+
+def iter_items(path, params=None, prefetch=True):
+    """Yields every item in the 'data' of each page of a paginated Graph edge (see iter_pages)."""
+    for page in iter_pages(path, params=params, prefetch=prefetch):
+        yield from page.get("data", [])
+
+
+class BatchResponse:
+    """Response-like wrapper around one entry of a Graph Batch API reply (exposes ok, status_code, text, json())."""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text or ""
+
+    @property
+    def ok(self):
+        return 200 <= self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text) if self.text else {}
+
+
+def graph_batch(batch_requests, access_token, timeout=None):
+    """Sends (path, params) GET requests as Graph Batch API POSTs of up to 50 and returns one response per request, in order."""
+    responses = []
+
+    for start in range(0, len(batch_requests), BATCH_LIMIT):
+        chunk = batch_requests[start:start + BATCH_LIMIT]
+        batch = []
+        for path, params in chunk:
+            query = {key: value for key, value in (params or {}).items() if key != "access_token"}
+            relative_url = f"{path.lstrip('/')}?{urlencode(query)}" if query else path.lstrip('/')
+            batch.append({"method": "GET", "relative_url": relative_url})
+
+        batch_response = graph_post("", data={
+            "access_token": access_token,
+            "batch": json.dumps(batch),
+            "include_headers": "false",
+        }, timeout=timeout, idempotent=True)  # A batch of GETs is safe to resend
+
+        if not batch_response.ok:
+            # The whole POST failed; report the same error against every request in the chunk
+            responses.extend(BatchResponse(batch_response.status_code, batch_response.text) for _ in chunk)
+            continue
+
+        for (path, params), item in zip(chunk, batch_response.json()):
+            if item is None:
+                # Graph did not finish this request within the batch; issue it on its own
+                responses.append(graph_get(path, params=params, timeout=timeout))
+            else:
+                responses.append(BatchResponse(item.get("code", 500), item.get("body")))
+
+    return responses
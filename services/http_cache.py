@@ -0,0 +1,103 @@
+import json
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Query parameters left out of cache keys so entries are shared across tokens and never store secrets
+UNCACHED_PARAMS = {"access_token", "appsecret_proof"}
+
+
+def cache_key(url, params=None):
+    """Builds a cache key from the URL and params with the access token stripped and parameters sorted."""
+    parsed = urlparse(url)
+    query = [(key, value) for key, value in parse_qsl(parsed.query) if key not in UNCACHED_PARAMS]
+    query += [(key, str(value)) for key, value in (params or {}).items() if key not in UNCACHED_PARAMS and value is not None]
+    return urlunparse(parsed._replace(query=urlencode(sorted(query))))
+
+
+class GraphResponseCache:
+    """SQLite-backed cache of Graph GET responses with per-entry expiry, ETags and size-bounded LRU eviction."""
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, body BLOB NOT NULL, headers TEXT NOT NULL, etag TEXT,"
+                " expires_at REAL NOT NULL, last_access REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        return self._conn
+
+    def get(self, key):
+        """Returns (response, is_fresh, etag) for a cached key, or None on a miss."""
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT body, headers, etag, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+
+        body, headers, etag, expires_at = row
+        return self._response(key, body, headers), expires_at > time.time(), etag
+
+    def store(self, key, response, ttl):
+        """Stores a successful response for ttl seconds and evicts least recently used entries over max_bytes."""
+        body = response.content
+        headers = json.dumps({name: value for name, value in response.headers.items() if name.lower() != "set-cookie"})
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, body, headers, etag, expires_at, last_access, size)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, body, headers, response.headers.get("ETag"), now + ttl, now, len(body)),
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def touch(self, key, ttl):
+        """Marks a cached entry fresh for another ttl seconds after Graph confirmed it unchanged (304)."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("UPDATE responses SET expires_at = ?, last_access = ? WHERE key = ?", (now + ttl, now, key))
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    @staticmethod
+    def _response(url, body, headers):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = body
+        response.headers = CaseInsensitiveDict(json.loads(headers))
+        response.headers.pop("Content-Encoding", None)  # The stored body is already decoded
+        response.url = url
+        response.encoding = "utf-8"
+        return response
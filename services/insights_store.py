@@ -0,0 +1,216 @@
+import json
+import sqlite3
+import threading
+import time
+from config import Config  # Ensure Config has the INSIGHTS_STORE_* settings
+
+# Metrics copied out of each insights row into their own columns (the full row is kept as JSON)
+ROW_METRICS = {"spend": float, "impressions": int, "reach": int, "clicks": int}
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS snapshots ("
+    " snapshot TEXT PRIMARY KEY, loaded_at REAL NOT NULL, ad_count INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS ads ("
+    " snapshot TEXT NOT NULL, ad_id TEXT NOT NULL, name TEXT, adset_id TEXT, campaign_id TEXT, status TEXT,"
+    " insights_error TEXT, data TEXT NOT NULL, PRIMARY KEY (snapshot, ad_id))",
+    "CREATE INDEX IF NOT EXISTS ads_campaign ON ads (snapshot, campaign_id, ad_id)",
+    "CREATE INDEX IF NOT EXISTS ads_adset ON ads (snapshot, adset_id, ad_id)",
+    "CREATE TABLE IF NOT EXISTS insights ("
+    " snapshot TEXT NOT NULL, ad_id TEXT NOT NULL, campaign_id TEXT, adset_id TEXT, date_start TEXT, date_stop TEXT,"
+    " publisher_platform TEXT, spend REAL, impressions INTEGER, reach INTEGER, clicks INTEGER, data TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS insights_ad ON insights (snapshot, ad_id, date_start)",
+    "CREATE INDEX IF NOT EXISTS insights_campaign ON insights (snapshot, campaign_id, date_start)",
+    "CREATE INDEX IF NOT EXISTS insights_adset ON insights (snapshot, adset_id, date_start)",
+    "CREATE INDEX IF NOT EXISTS insights_date ON insights (snapshot, date_start)",
+    "CREATE INDEX IF NOT EXISTS insights_platform ON insights (snapshot, publisher_platform, date_start)",
+    "CREATE TABLE IF NOT EXISTS platform_splits ("
+    " snapshot TEXT NOT NULL, ad_id TEXT NOT NULL, publisher_platform TEXT NOT NULL, row_count INTEGER NOT NULL,"
+    " spend REAL, impressions INTEGER, reach INTEGER, clicks INTEGER,"
+    " PRIMARY KEY (snapshot, ad_id, publisher_platform))",
+    "CREATE INDEX IF NOT EXISTS platform_splits_platform ON platform_splits (snapshot, publisher_platform)",
+    "CREATE TABLE IF NOT EXISTS breakdowns ("
+    " snapshot TEXT NOT NULL, breakdown TEXT NOT NULL, publisher_platform TEXT, data TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS breakdowns_snapshot ON breakdowns (snapshot, breakdown, publisher_platform)",
+)
+
+
+def _metric(row, name):
+    try:
+        return ROW_METRICS[name](row[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class InsightsStore:
+    """
+    SQLite store of the saved Meta snapshots in normalized, indexed tables.
+
+    Each refresh replaces its snapshot's ads, insights rows, per-platform splits and breakdown rows in
+    one transaction. Ads are keyed by (snapshot, ad_id); insights rows are indexed by ad, campaign,
+    ad set, date_start and publisher_platform so filtered queries never load a whole snapshot.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+        return self._conn
+
+    def has_snapshot(self, snapshot):
+        with self._lock:
+            return self._connection().execute("SELECT 1 FROM snapshots WHERE snapshot = ?", (snapshot,)).fetchone() is not None
+
+    def save_snapshot(self, snapshot, data):
+        """Replaces everything stored for snapshot with the ads and breakdowns in data."""
+        ads, insights, splits, breakdowns = [], [], [], []
+        for ad in data.get("ads_data", []):
+            ad_id = ad.get("id")
+            rows = ad.get("insights") if isinstance(ad.get("insights"), list) else []
+            ad_fields = {key: value for key, value in ad.items() if key not in ("insights", "insights_by_platform", "breakdown_insights")}
+            ads.append((
+                snapshot, ad_id, ad.get("name"), ad.get("adset_id"), ad.get("campaign_id"), ad.get("status"),
+                ad.get("insights") if isinstance(ad.get("insights"), str) else None, json.dumps(ad_fields),
+            ))
+
+            totals = {}
+            for row in rows:
+                platform = row.get("publisher_platform")
+                metrics = [_metric(row, name) for name in ROW_METRICS]
+                insights.append((
+                    snapshot, ad_id, row.get("campaign_id", ad.get("campaign_id")), row.get("adset_id", ad.get("adset_id")),
+                    row.get("date_start"), row.get("date_stop"), platform, *metrics, json.dumps(row),
+                ))
+                split = totals.setdefault(platform or "unknown", [0] + [None] * len(ROW_METRICS))
+                split[0] += 1
+                for index, value in enumerate(metrics, start=1):
+                    if value is not None:
+                        split[index] = (split[index] or 0) + value
+            splits.extend((snapshot, ad_id, platform, *split) for platform, split in totals.items())
+
+        for breakdown, rows in (data.get("breakdown_insights") or {}).items():
+            if isinstance(rows, list):
+                breakdowns.extend((snapshot, breakdown, row.get("publisher_platform"), json.dumps(row)) for row in rows)
+
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                for table in ("ads", "insights", "platform_splits", "breakdowns"):
+                    conn.execute(f"DELETE FROM {table} WHERE snapshot = ?", (snapshot,))
+                conn.executemany("INSERT OR REPLACE INTO ads VALUES (?, ?, ?, ?, ?, ?, ?, ?)", ads)
+                conn.executemany("INSERT INTO insights VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", insights)
+                conn.executemany("INSERT OR REPLACE INTO platform_splits VALUES (?, ?, ?, ?, ?, ?, ?, ?)", splits)
+                conn.executemany("INSERT INTO breakdowns VALUES (?, ?, ?, ?)", breakdowns)
+                conn.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)", (snapshot, time.time(), len(ads)))
+
+    def get_ad(self, snapshot, ad_id, platform=None, since=None, until=None):
+        """Returns one ad with its insights rows and platform splits (primary-key lookups), or None."""
+        with self._lock:
+            conn = self._connection()
+            ad = conn.execute(
+                "SELECT ad_id, insights_error, data FROM ads WHERE snapshot = ? AND ad_id = ?", (snapshot, ad_id)
+            ).fetchone()
+            if ad is None:
+                return None
+            rows = self._insights_rows(conn, snapshot, [ad_id], platform, since, until).get(ad_id, [])
+            splits = conn.execute(
+                "SELECT publisher_platform, row_count, spend, impressions, reach, clicks FROM platform_splits"
+                " WHERE snapshot = ? AND ad_id = ?", (snapshot, ad_id)
+            ).fetchall()
+
+        result = self._ad(ad, rows)
+        result["platform_splits"] = {
+            split[0]: dict(zip(("rows", *ROW_METRICS), split[1:])) for split in splits
+        }
+        return result
+
+    def query_ads(self, snapshot, campaign_id=None, adset_id=None, platform=None, since=None, until=None,
+                  limit=50, after=None):
+        """
+        Returns (ads, last_ad_id) for one page of ads ordered by ad_id, starting after `after`.
+
+        campaign_id/adset_id filter ads; platform/since/until (on date_start) filter their insights rows,
+        and ads without a matching row are left out. last_ad_id is None on the last page.
+        """
+        where, args = ["snapshot = ?"], [snapshot]
+        if campaign_id:
+            where.append("campaign_id = ?")
+            args.append(campaign_id)
+        if adset_id:
+            where.append("adset_id = ?")
+            args.append(adset_id)
+        row_where, row_args = self._row_filters(platform, since, until)
+        if row_where:
+            where.append(
+                "EXISTS (SELECT 1 FROM insights i WHERE i.snapshot = ads.snapshot AND i.ad_id = ads.ad_id AND "
+                + " AND ".join(f"i.{condition}" for condition in row_where) + ")"
+            )
+            args.extend(row_args)
+        if after:
+            where.append("ad_id > ?")
+            args.append(after)
+
+        with self._lock:
+            conn = self._connection()
+            ads = conn.execute(
+                f"SELECT ad_id, insights_error, data FROM ads WHERE {' AND '.join(where)} ORDER BY ad_id LIMIT ?",
+                (*args, limit + 1),
+            ).fetchall()
+            page = ads[:limit]
+            rows = self._insights_rows(conn, snapshot, [ad[0] for ad in page], platform, since, until)
+
+        last_ad_id = page[-1][0] if len(ads) > limit else None
+        return [self._ad(ad, rows.get(ad[0], [])) for ad in page], last_ad_id
+
+    def _insights_rows(self, conn, snapshot, ad_ids, platform, since, until):
+        if not ad_ids:
+            return {}
+        row_where, row_args = self._row_filters(platform, since, until)
+        where = ["snapshot = ?", f"ad_id IN ({', '.join('?' * len(ad_ids))})", *row_where]
+        rows_by_ad = {}
+        for ad_id, data in conn.execute(
+            f"SELECT ad_id, data FROM insights WHERE {' AND '.join(where)} ORDER BY ad_id, date_start, rowid",
+            (snapshot, *ad_ids, *row_args),
+        ):
+            rows_by_ad.setdefault(ad_id, []).append(json.loads(data))
+        return rows_by_ad
+
+    @staticmethod
+    def _row_filters(platform, since, until):
+        where, args = [], []
+        if platform:
+            where.append("publisher_platform = ?")
+            args.append(platform)
+        if since:
+            where.append("date_start >= ?")
+            args.append(since)
+        if until:
+            where.append("date_start <= ?")
+            args.append(until)
+        return where, args
+
+    @staticmethod
+    def _ad(ad, rows):
+        _, insights_error, data = ad
+        result = json.loads(data)
+        result["insights"] = insights_error if insights_error is not None else rows
+        return result
+
+
+insights_store = InsightsStore(Config.INSIGHTS_STORE_PATH) if Config.INSIGHTS_STORE_ENABLED else None
+
+
+def store_snapshot(snapshot, data):
+    """Saves a refreshed snapshot into the insights store, if enabled; a store error never fails the refresh."""
+    if insights_store is None:
+        return
+    try:
+        insights_store.save_snapshot(snapshot, data)
+    except sqlite3.Error as e:
+        print(f"Failed to update the insights store for {snapshot}: {e}")
@@ -0,0 +1,107 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config import Config  # Ensure Config has REFRESH_JOB_WORKERS and REFRESH_JOB_RETENTION
+from services.progress import Progress, track
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class Job:
+    """One background snapshot refresh: its options, status, progress counters and final (body, status_code)."""
+
+    def __init__(self, snapshot, options):
+        self.id = uuid.uuid4().hex
+        self.snapshot = snapshot
+        self.options = options
+        self.status = QUEUED
+        self.progress = Progress()
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.status_code = None
+        self.result = None
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def summary(self):
+        return {"job_id": self.id, "snapshot": self.snapshot, "status": self.status, "status_url": f"/jobs/{self.id}"}
+
+    def as_dict(self):
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+        job = self.summary()
+        job.update({
+            "options": self.options,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": elapsed,
+            "progress": self.progress.as_dict(),
+            "status_code": self.status_code,
+            "result": self.result,
+        })
+        return job
+
+
+class RefreshJobs:
+    """
+    Runs snapshot refreshes on a background worker pool and keeps their status for the job API.
+
+    A refresh is any callable taking the options dict and returning (body, status_code), like the
+    controllers' run_refresh. Submitting a snapshot that already has a queued or running job returns
+    that job. Finished jobs are kept for REFRESH_JOB_RETENTION seconds; jobs live in this process only.
+    """
+
+    def __init__(self, max_workers, retention):
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="refresh-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, snapshot, refresh, options=None):
+        """Queues refresh(options) for snapshot and returns its Job."""
+        with self._lock:
+            self._prune()
+            for job in self._jobs.values():
+                if job.snapshot == snapshot and job.active:
+                    return job
+            job = Job(snapshot, dict(options or {}))
+            self._jobs[job.id] = job
+
+        self._executor.submit(self._run, job, refresh)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, refresh):
+        job.started_at = time.time()
+        job.status = RUNNING
+        try:
+            with track(job.progress):
+                body, status_code = refresh(job.options)
+        except Exception as e:
+            body, status_code = {"error": "Internal Server Error", "details": str(e)}, 500
+
+        job.result = body
+        job.status_code = status_code
+        job.finished_at = time.time()
+        job.status = SUCCEEDED if status_code < 400 else FAILED
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+refresh_jobs = RefreshJobs(Config.REFRESH_JOB_WORKERS, Config.REFRESH_JOB_RETENTION)
@@ -0,0 +1,484 @@
+import datetime
+import decimal
+import json
+import time
+import requests
+from config import Config  # Ensure Config has the BREAKDOWN_* and ASYNC_REPORT_* settings
+from services.graph_api import graph_get, graph_post, graph_batch, iter_pages, iter_items
+from services.concurrency import bounded_map
+from services.cache import TTLCache
+from services.snapshots import load_snapshot
+from services import progress
+
+# Supported ways of issuing the insights requests for a list of ads
+FETCH_MODES = ("sequential", "concurrent", "batch", "account", "async")
+
+# Supported insights sync strategies: re-download everything, or sync daily rows from per-ad watermarks
+SYNC_MODES = ("full", "incremental")
+
+if Config.ADS_FETCH_MODE not in FETCH_MODES:
+    raise ValueError(f"ADS_FETCH_MODE must be one of {', '.join(FETCH_MODES)}, not '{Config.ADS_FETCH_MODE}'")
+if Config.INSIGHTS_SYNC not in SYNC_MODES:
+    raise ValueError(f"INSIGHTS_SYNC must be one of {', '.join(SYNC_MODES)}, not '{Config.INSIGHTS_SYNC}'")
+
+# Terminal async_status values of an insights report run
+ASYNC_REPORT_DONE = "Job Completed"
+ASYNC_REPORT_FAILED = ("Job Failed", "Job Skipped")
+
+# Rows per page for account-level (level=ad) insights
+ACCOUNT_INSIGHTS_PAGE_LIMIT = 500
+
+# Account-level breakdown dimensions reported alongside the ads
+BREAKDOWNS = ['age', 'region', 'gender', 'device_platform']
+
+# Metrics that can be summed across date shards; the rest (unique counts, frequency, rates) are reported per shard
+ADDITIVE_METRICS = {"impressions", "clicks", "spend", "inline_link_clicks", "inline_post_engagement"}
+NON_ADDITIVE_METRICS = {"reach", "unique_clicks", "frequency", "cpm", "cpc", "cpp", "ctr", "unique_ctr"}
+
+# Oldest insights Graph serves, in months
+INSIGHTS_MAX_HISTORY_MONTHS = 37
+
+# Breakdown results keyed by (ad_account_id, date_preset, publisher_platform)
+_breakdown_cache = TTLCache(Config.BREAKDOWN_CACHE_TTL)
+
+
+class InsightsRows:
+    """Response-like view (ok, status_code, text, json()) over insight rows already fetched for one ad."""
+
+    ok = True
+    status_code = 200
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @property
+    def text(self):
+        return json.dumps({"data": self.rows})
+
+    def json(self):
+        return {"data": self.rows}
+
+
+def group_by_platform(insights_data):
+    """Groups insight rows by publisher_platform (Facebook, Instagram, Audience Network), defaulting to 'unknown'."""
+    platform_data = {}
+    for insight in insights_data:
+        platform = insight.get('publisher_platform', 'unknown')
+        if platform not in platform_data:
+            platform_data[platform] = []
+        platform_data[platform].append(insight)
+    return platform_data
+
+
+def fetch_ads(ad_account_id, access_token):
+    """Lists every ad in the account (all pages). Raises requests.exceptions.HTTPError if a page fails."""
+    ads_params = {
+        "fields": "id,name,adset_id,campaign_id,status",  # Basic ad fields
+        "access_token": access_token
+    }
+    return list(iter_items(f"{ad_account_id}/ads", params=ads_params))
+
+
+def use_async_reports(ad_count):
+    """Returns True when an account with ad_count ads should use async insights report runs."""
+    threshold = Config.ASYNC_INSIGHTS_AD_THRESHOLD
+    return threshold > 0 and ad_count >= threshold
+
+
+def iter_async_report_pages(ad_account_id, params):
+    """
+    Runs an async insights report for the account and yields the pages of its results.
+
+    POSTs the query to /{ad_account_id}/insights, polls the report_run_id with exponential backoff
+    until Graph reports it complete, then pages through /{report_run_id}/insights.
+    Raises a requests exception if the job fails, is skipped or exceeds ASYNC_REPORT_TIMEOUT.
+    """
+    access_token = params.get("access_token")
+    response = graph_post(f"{ad_account_id}/insights", data=params)
+    if not response.ok:
+        raise requests.exceptions.HTTPError(response.text, response=response)
+
+    report_run_id = response.json().get("report_run_id")
+    if not report_run_id:
+        raise requests.exceptions.RequestException(f"No report_run_id in response: {response.text}")
+
+    delay = Config.ASYNC_REPORT_POLL_INTERVAL
+    deadline = time.monotonic() + Config.ASYNC_REPORT_TIMEOUT
+    while True:
+        status_response = graph_get(report_run_id, params={
+            "fields": "async_status,async_percent_completion",
+            "access_token": access_token,
+        })
+        if not status_response.ok:
+            raise requests.exceptions.HTTPError(status_response.text, response=status_response)
+
+        status = status_response.json().get("async_status")
+        if status == ASYNC_REPORT_DONE:
+            break
+        if status in ASYNC_REPORT_FAILED:
+            raise requests.exceptions.RequestException(f"Async report {report_run_id} ended with status '{status}'")
+        if time.monotonic() + delay > deadline:
+            raise requests.exceptions.Timeout(f"Async report {report_run_id} did not finish within {Config.ASYNC_REPORT_TIMEOUT}s")
+
+        time.sleep(delay)
+        delay = min(delay * 2, Config.ASYNC_REPORT_POLL_MAX_INTERVAL)
+
+    yield from iter_pages(f"{report_run_id}/insights", params={
+        "access_token": access_token,
+        "limit": ACCOUNT_INSIGHTS_PAGE_LIMIT,
+    })
+
+
+def fetch_account_insights_by_ad(ad_account_id, insights_params, async_report=False):
+    """Pages through /{ad_account_id}/insights?level=ad (or an async report run of it) and returns the rows grouped by ad_id."""
+    params = dict(insights_params)
+    fields = params.get("fields", "").split(",") if params.get("fields") else []
+    if "ad_id" not in fields:
+        fields.append("ad_id")  # Needed to join the rows back onto the ads list
+    params["fields"] = ",".join(fields)
+    params["level"] = "ad"
+    params["limit"] = ACCOUNT_INSIGHTS_PAGE_LIMIT
+
+    if async_report:
+        pages = iter_async_report_pages(ad_account_id, params)
+    else:
+        pages = iter_pages(f"{ad_account_id}/insights", params=params)
+
+    rows_by_ad = {}
+    for page in pages:
+        for row in page.get("data", []):
+            rows_by_ad.setdefault(row.get("ad_id"), []).append(row)
+
+    return rows_by_ad
+
+
+def record_insights_error(ad, error):
+    """Stores a failed insights fetch on the ad as its insights error string."""
+    ad["insights"] = f"Failed to fetch insights: {error}"
+
+
+def apply_or_record_error(apply_insights, ad, insights_response):
+    """Runs apply_insights(ad, insights_response); a request it makes itself (e.g. following paging.next) that fails is stored on the ad."""
+    try:
+        apply_insights(ad, insights_response)
+    except requests.exceptions.RequestException as e:
+        record_insights_error(ad, e)
+
+
+def fetch_ads_insights(ad_account_id, ads_data, insights_params, apply_insights, mode="sequential", max_workers=None,
+                       record_error=record_insights_error):
+    """
+    Fetches insights for every ad with the given params and applies each result to its ad, preserving the ads order.
+
+    apply_insights(ad, response) stores the result on the ad; response exposes ok, text and json().
+    Modes: "sequential" (one call per ad), "concurrent" (bounded worker pool), "batch" (Graph Batch API),
+    "account" (one paginated /{ad_account_id}/insights?level=ad query joined on ad_id) and "async"
+    (the same level=ad query as an async report run). Accounts with at least ASYNC_INSIGHTS_AD_THRESHOLD
+    ads always use "async". A failed request is passed to record_error(ad, error) instead of
+    apply_insights (by default stored on the ad as an insights error string) and never aborts the refresh.
+    """
+    access_token = insights_params.get("access_token")
+
+    if use_async_reports(len(ads_data)):
+        mode = "async"
+
+    if mode in ("account", "async"):
+        try:
+            rows_by_ad = fetch_account_insights_by_ad(ad_account_id, insights_params, async_report=mode == "async")
+        except requests.exceptions.RequestException as e:
+            for ad in ads_data:
+                record_error(ad, e)
+            return ads_data
+
+        for ad in ads_data:
+            apply_or_record_error(apply_insights, ad, InsightsRows(rows_by_ad.get(ad.get("id"), [])))
+        return ads_data
+
+    if mode == "batch":
+        try:
+            responses = graph_batch([(f"{ad.get('id')}/insights", insights_params) for ad in ads_data], access_token)
+        except requests.exceptions.RequestException as e:
+            for ad in ads_data:
+                record_error(ad, e)
+            return ads_data
+
+        for ad, response in zip(ads_data, responses):
+            apply_or_record_error(apply_insights, ad, response)
+        return ads_data
+
+    def fetch_one(ad):
+        try:
+            response = graph_get(f"{ad.get('id')}/insights", params=insights_params)
+        except requests.exceptions.RequestException as e:
+            record_error(ad, e)
+            return ad
+        apply_or_record_error(apply_insights, ad, response)
+        return ad
+
+    workers = max_workers if mode == "concurrent" else 1
+    return bounded_map(fetch_one, ads_data, max_workers=workers)
+
+
+def add_months(day, months):
+    """Returns the first day of the month `months` after the month of `day`."""
+    month_index = day.year * 12 + day.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def month_shards(start, end, months=1):
+    """Splits [start, end] into consecutive {'since', 'until'} time ranges of `months` calendar months each."""
+    shards = []
+    since = start
+    while since <= end:
+        until = min(add_months(since, months) - datetime.timedelta(days=1), end)
+        shards.append({"since": since.isoformat(), "until": until.isoformat()})
+        since = until + datetime.timedelta(days=1)
+    return shards
+
+
+def fetch_history_start(ad_account_id, access_token):
+    """Returns the first date worth querying: the account's creation date, bounded by Graph's history limit."""
+    earliest = add_months(datetime.date.today(), -INSIGHTS_MAX_HISTORY_MONTHS + 1)
+    try:
+        response = graph_get(ad_account_id, params={"fields": "created_time", "access_token": access_token})
+    except requests.exceptions.RequestException:
+        return earliest
+
+    created_time = response.json().get("created_time") if response.ok else None
+    if not created_time:
+        return earliest
+    return max(earliest, datetime.date.fromisoformat(created_time[:10]))
+
+
+def merge_shard_rows(shard_rows):
+    """
+    Merges per-shard insight rows that share the same breakdown values.
+
+    Additive metrics are summed exactly; non-additive ones (unique counts, frequency, rates) cannot be combined
+    across shards, so they are left out of the merged row and listed in '<metric>_per_shard' with
+    each shard's date range, and named in 'per_shard_metrics'.
+    """
+    merged = {}
+    for rows in shard_rows:
+        for row in rows:
+            dimension_values = tuple(sorted(
+                (key, value) for key, value in row.items()
+                if key not in ADDITIVE_METRICS | NON_ADDITIVE_METRICS | {"date_start", "date_stop"}
+            ))
+            target = merged.get(dimension_values)
+            if target is None:
+                target = merged[dimension_values] = dict(dimension_values)
+                target["date_start"] = row.get("date_start")
+
+            target["date_stop"] = row.get("date_stop")
+            for metric in ADDITIVE_METRICS & row.keys():
+                # Decimal keeps Graph's full precision (spend has up to 6 decimals) without float drift
+                total = decimal.Decimal(str(target.get(metric, 0))) + decimal.Decimal(str(row[metric]))
+                target[metric] = str(total)
+            for metric in NON_ADDITIVE_METRICS & row.keys():
+                target.setdefault(f"{metric}_per_shard", []).append({
+                    "date_start": row.get("date_start"),
+                    "date_stop": row.get("date_stop"),
+                    metric: row[metric],
+                })
+                if metric not in target.setdefault("per_shard_metrics", []):
+                    target["per_shard_metrics"].append(metric)
+
+    return list(merged.values())
+
+
+def fetch_breakdown_insights(ad_account_id, access_token, date_preset='maximum', publisher_platform=None, async_report=False,
+                             sharded=None):
+    """
+    Fetch account insights separately for Age, Region, Gender, and Device Platform with pagination.
+
+    The four dimensions are fetched concurrently, each one prefetching its next page while the current
+    page is filtered (or, with async_report, as async report runs for large accounts). With sharding
+    (BREAKDOWN_SHARDING by default) a 'maximum' query is split into BREAKDOWN_SHARD_MONTHS time_range
+    shards that run in parallel and are merged with merge_shard_rows. Results are memoized per account,
+    date preset, platform filter and sharding for BREAKDOWN_CACHE_TTL seconds; responses containing an
+    error are returned but not cached.
+    """
+    if sharded is None:
+        sharded = Config.BREAKDOWN_SHARDING
+    sharded = sharded and date_preset == 'maximum' and not async_report
+
+    cache_key = (ad_account_id, date_preset, publisher_platform, sharded)
+    cached = _breakdown_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    COMMON_PARAMS = {
+        'access_token': access_token,
+        'fields': 'reach,impressions,clicks',  # Fetching only required fields
+    }
+
+    def fetch_dimension(breakdown, time_range=None):
+        params = COMMON_PARAMS.copy()
+        params['breakdowns'] = breakdown  # Set the specific breakdown
+        if time_range:
+            params['time_range'] = json.dumps(time_range)
+        else:
+            params['date_preset'] = date_preset
+
+        all_data = []  # To store all the paginated results
+        try:
+            if async_report:
+                pages = iter_async_report_pages(ad_account_id, params)
+            else:
+                pages = iter_pages(f"{ad_account_id}/insights", params=params)
+
+            for page in pages:
+                if 'data' not in page:
+                    return {"error": "No data or error in response"}
+
+                rows = page['data']
+                if publisher_platform:
+                    rows = [entry for entry in rows if entry.get("publisher_platform") == publisher_platform]
+                all_data.extend(rows)
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e)}
+
+        return all_data
+
+    if sharded:
+        shards = month_shards(fetch_history_start(ad_account_id, access_token), datetime.date.today(),
+                              Config.BREAKDOWN_SHARD_MONTHS)
+        tasks = [(breakdown, shard) for breakdown in BREAKDOWNS for shard in shards]
+        results = bounded_map(lambda task: fetch_dimension(*task), tasks, max_workers=len(tasks))
+
+        breakdown_data = {}
+        for index, breakdown in enumerate(BREAKDOWNS):
+            shard_rows = results[index * len(shards):(index + 1) * len(shards)]
+            errors = [rows for rows in shard_rows if isinstance(rows, dict)]
+            breakdown_data[breakdown] = errors[0] if errors else merge_shard_rows(shard_rows)
+    else:
+        breakdown_data = dict(zip(BREAKDOWNS, bounded_map(fetch_dimension, BREAKDOWNS, max_workers=len(BREAKDOWNS))))
+
+    if not any(isinstance(value, dict) and "error" in value for value in breakdown_data.values()):
+        _breakdown_cache.set(cache_key, breakdown_data)
+
+    return breakdown_data
+
+
+def sync_ads_insights(ad_account_id, ads_data, insights_params, apply_insights, previous_snapshot,
+                      record_error=record_insights_error):
+    """
+    Incrementally syncs daily insights for the ads onto the rows kept in the previous snapshot.
+
+    Each ad's watermark (last fully synced day) is read from the snapshot's sync_state. Known ads are
+    re-fetched from their watermark minus INSIGHTS_ATTRIBUTION_WINDOW_DAYS (late-attributed conversions
+    still change those days); ads without a watermark get their full history. Both use account-level
+    level=ad queries with time_increment=1, so the cost scales with new days rather than total history.
+    The merged daily rows go through apply_insights like any other mode; if the sync fails, known ads
+    keep their previous rows and new ads are passed to record_error(ad, error).
+
+    Returns (ads_data, sync_state) where sync_state must be stored in the new snapshot.
+    """
+    previous_state = previous_snapshot.get("sync_state", {})
+    previous_watermarks = previous_state.get("ad_watermarks", {}) if previous_state.get("mode") == "incremental" else {}
+    previous_rows = {
+        ad.get("id"): ad["insights"]
+        for ad in previous_snapshot.get("ads_data", [])
+        if ad.get("id") in previous_watermarks and isinstance(ad.get("insights"), list)
+    }
+
+    today = datetime.date.today()
+    watermark = (today - datetime.timedelta(days=1)).isoformat()  # Today is still accumulating
+    async_report = use_async_reports(len(ads_data))
+
+    known_ads = [ad for ad in ads_data if ad.get("id") in previous_rows]
+    new_ads = [ad for ad in ads_data if ad.get("id") not in previous_rows]
+
+    def fetch_daily(ads, since, filter_ids):
+        params = dict(insights_params)
+        params["time_range"] = json.dumps({"since": since.isoformat(), "until": today.isoformat()})
+        params["time_increment"] = 1
+        if filter_ids:
+            params["filtering"] = json.dumps([{"field": "ad.id", "operator": "IN", "value": [ad.get("id") for ad in ads]}])
+        return fetch_account_insights_by_ad(ad_account_id, params, async_report=async_report)
+
+    fetched = {}
+    refetch_from = {}
+    try:
+        if known_ads:
+            oldest_watermark = min(datetime.date.fromisoformat(previous_watermarks[ad.get("id")]) for ad in known_ads)
+            since = oldest_watermark - datetime.timedelta(days=Config.INSIGHTS_ATTRIBUTION_WINDOW_DAYS - 1)
+            known_rows = fetch_daily(known_ads, since, filter_ids=False)
+            fetched.update({ad.get("id"): known_rows.get(ad.get("id"), []) for ad in known_ads})
+            refetch_from.update({ad.get("id"): since.isoformat() for ad in known_ads})
+        if new_ads:
+            history_start = fetch_history_start(ad_account_id, insights_params.get("access_token"))
+            for ad_id, rows in fetch_daily(new_ads, history_start, filter_ids=True).items():
+                fetched.setdefault(ad_id, []).extend(rows)
+    except requests.exceptions.RequestException as e:
+        # Keep the previously synced rows and watermarks; only the new days are missing
+        for ad in ads_data:
+            if ad.get("id") in previous_rows:
+                apply_or_record_error(apply_insights, ad, InsightsRows(previous_rows[ad.get("id")]))
+            else:
+                record_error(ad, e)
+        return ads_data, previous_state or {"mode": "incremental", "ad_watermarks": {}}
+
+    ad_watermarks = {}
+    for ad in ads_data:
+        ad_id = ad.get("id")
+        kept = [row for row in previous_rows.get(ad_id, []) if row.get("date_start", "") < refetch_from.get(ad_id, "")]
+        rows = sorted(kept + fetched.get(ad_id, []), key=lambda row: row.get("date_start", ""))
+        apply_or_record_error(apply_insights, ad, InsightsRows(rows))
+        ad_watermarks[ad_id] = watermark
+
+    return ads_data, {"mode": "incremental", "ad_watermarks": ad_watermarks}
+
+
+class InvalidOptionError(ValueError):
+    """Raised for an unknown refresh option value; the message is safe to return to the client."""
+
+
+def check_refresh_options(options):
+    """Raises InvalidOptionError when options (e.g. request.args) name an unknown fetch mode or sync strategy."""
+    mode = options.get("mode", Config.ADS_FETCH_MODE)
+    if mode not in FETCH_MODES:
+        raise InvalidOptionError(f"Unknown mode '{mode}'; expected one of {', '.join(FETCH_MODES)}")
+    sync = options.get("sync", Config.INSIGHTS_SYNC)
+    if sync not in SYNC_MODES:
+        raise InvalidOptionError(f"Unknown sync '{sync}'; expected one of {', '.join(SYNC_MODES)}")
+
+
+def refresh_ads_insights(ad_account_id, ads_data, insights_params, apply_insights, options, snapshot_path):
+    """
+    Fetches insights for one refresh as selected by the request options and returns (ads_data, sync_state).
+
+    options (e.g. request.args) may set "sync" (full/incremental, default INSIGHTS_SYNC), "mode"
+    (default ADS_FETCH_MODE) and "concurrency". sync_state is None for full refreshes.
+    Progress (ads done out of total) is reported to the refresh being tracked, if any.
+    Raises InvalidOptionError for an unknown mode or sync value.
+    """
+    check_refresh_options(options)
+    progress.set_ads_total(len(ads_data))
+
+    def apply_and_record(ad, insights_response):
+        try:
+            apply_insights(ad, insights_response)
+        finally:
+            progress.record_ad_done()
+
+    def record_error_and_count(ad, error):
+        record_insights_error(ad, error)
+        progress.record_ad_done()
+
+    if options.get("sync", Config.INSIGHTS_SYNC) == "incremental":
+        return sync_ads_insights(
+            ad_account_id, ads_data, insights_params, apply_and_record, load_snapshot(snapshot_path), record_error_and_count
+        )
+
+    ads_data = fetch_ads_insights(
+        ad_account_id,
+        ads_data,
+        insights_params,
+        apply_and_record,
+        mode=options.get("mode", Config.ADS_FETCH_MODE),
+        max_workers=options.get("concurrency"),
+        record_error=record_error_and_count,
+    )
+    return ads_data, None
@@ -0,0 +1,40 @@
+import base64
+import json
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class PaginationError(ValueError):
+    """Raised for an invalid limit or cursor; the message is safe to return to the client."""
+
+
+def encode_cursor(position):
+    """Encodes a JSON-serializable position as an opaque URL-safe cursor."""
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Returns the position encoded in cursor, or None when no cursor was given."""
+    if not cursor:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise PaginationError("Invalid cursor")
+
+
+def parse_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    """Parses a ?limit= value, clamped to [1, maximum]."""
+    if value is None or value == "":
+        return default
+    try:
+        return max(1, min(int(value), maximum))
+    except ValueError:
+        raise PaginationError("limit must be an integer")
+
+
+def parse_fields(value):
+    """Splits a ?fields= value into a list of field names (dotted paths allowed), or None for all fields."""
+    fields = [field.strip() for field in (value or "").split(",") if field.strip()]
+    return fields or None
@@ -0,0 +1,56 @@
+import contextvars
+import threading
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("refresh_progress", default=None)
+
+
+class Progress:
+    """Thread-safe counters for one refresh: ads with insights applied, total ads and Graph API calls sent."""
+
+    def __init__(self):
+        self.ads_done = 0
+        self.ads_total = None
+        self.api_calls = 0
+        self._lock = threading.Lock()
+
+    def as_dict(self):
+        with self._lock:
+            return {"ads_done": self.ads_done, "ads_total": self.ads_total, "api_calls": self.api_calls}
+
+
+@contextmanager
+def track(progress):
+    """Reports the refresh work done in this context (and the pools it fans out to) into progress."""
+    token = _current.set(progress)
+    try:
+        yield progress
+    finally:
+        _current.reset(token)
+
+
+def set_ads_total(total):
+    progress = _current.get()
+    if progress is not None:
+        with progress._lock:
+            progress.ads_total = total
+
+
+def record_ad_done():
+    progress = _current.get()
+    if progress is not None:
+        with progress._lock:
+            progress.ads_done += 1
+
+
+def record_api_call():
+    progress = _current.get()
+    if progress is not None:
+        with progress._lock:
+            progress.api_calls += 1
+
+
+def in_context(func):
+    """Wraps func to run in a copy of the caller's context, so pool threads report to the same progress."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
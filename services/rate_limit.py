@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from config import Config  # Ensure Config has GRAPH_POOL_SIZE and the GRAPH_USAGE_* settings
+
+# Response headers in which Graph reports how close we are to its rate limits
+USAGE_HEADERS = (
+    "X-App-Usage",
+    "X-Ad-Account-Usage",
+    "X-Business-Use-Case-Usage",
+    "X-FB-Ads-Insights-Throttle",
+)
+
+
+def parse_usage_headers(headers):
+    """
+    Reads the Graph usage headers and returns (highest usage percentage, seconds until access is regained).
+
+    Returns (None, 0) when the response carries no usage information.
+    """
+    percentages = []
+    regain_seconds = 0
+
+    for name in USAGE_HEADERS:
+        raw = headers.get(name)
+        if not raw:
+            continue
+        try:
+            usage = json.loads(raw)
+        except ValueError:
+            continue
+
+        if name == "X-Business-Use-Case-Usage":
+            # {"<business_id>": [{"type": ..., "call_count": .., "total_cputime": .., "total_time": .., "estimated_time_to_regain_access": minutes}]}
+            entries = [entry for value in usage.values() if isinstance(value, list) for entry in value]
+        else:
+            entries = [usage]
+
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            for key in ("call_count", "total_cputime", "total_time", "acc_id_util_pct", "app_id_util_pct"):
+                if isinstance(entry.get(key), (int, float)):
+                    percentages.append(float(entry[key]))
+            regain_seconds = max(regain_seconds, float(entry.get("estimated_time_to_regain_access") or 0) * 60)
+
+    return (max(percentages) if percentages else None), regain_seconds
+
+
+class UsageScheduler:
+    """Gates Graph calls behind a concurrency limit that adapts to the usage Graph reports in its response headers."""
+
+    def __init__(self, max_concurrency, min_concurrency=1):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = max_concurrency
+        self.last_usage = None
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """Waits until a call may be sent (no pause active and below the current limit) and holds a slot for it."""
+        with self._cond:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0 and self._in_flight < self.limit:
+                    break
+                self._cond.wait(timeout=wait if wait > 0 else None)
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def record(self, headers):
+        """Adjusts the concurrency limit (and pauses if needed) from one response's usage headers."""
+        usage, regain_seconds = parse_usage_headers(headers)
+        if usage is None and not regain_seconds:
+            return
+
+        with self._cond:
+            self.last_usage = usage
+            if regain_seconds or (usage is not None and usage >= Config.GRAPH_USAGE_PAUSE_PCT):
+                # Stop sending until Graph says we are allowed again, before it starts rejecting calls
+                pause = min(regain_seconds or Config.GRAPH_THROTTLE_PAUSE, Config.GRAPH_MAX_PAUSE)
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                self.limit = self.min_concurrency
+                print(f"Graph usage at {usage}%, pausing calls for {pause:.0f}s")
+            elif usage >= Config.GRAPH_USAGE_SLOWDOWN_PCT:
+                self.limit = max(self.min_concurrency, self.limit // 2)
+            elif usage < Config.GRAPH_USAGE_SLOWDOWN_PCT / 2:
+                self.limit = min(self.max_concurrency, self.limit + 1)
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        """Stops every caller from sending for the given number of seconds."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + min(seconds, Config.GRAPH_MAX_PAUSE))
+            self.limit = self.min_concurrency
+            self._cond.notify_all()
+
+
+usage_scheduler = UsageScheduler(Config.GRAPH_POOL_SIZE)
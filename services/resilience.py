@@ -0,0 +1,141 @@
+import random
+import re
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+import urllib3
+from config import Config  # Ensure Config has the GRAPH_RETRY_* and GRAPH_BREAKER_* settings
+
+# Graph error codes that mean "slow down" (app, user, page, custom and ads rate limits)
+THROTTLE_CODES = {4, 17, 32, 613} | set(range(80000, 80015))
+# Graph error codes for temporary server-side problems
+TRANSIENT_CODES = {1, 2}
+# Graph error codes for invalid/expired tokens and missing permissions; retrying never helps
+AUTH_CODES = {102, 190} | set(range(200, 300)) | {10}
+# Subset of AUTH_CODES meaning the token itself is invalid or expired (the rest are missing permissions)
+TOKEN_ERROR_CODES = {102, 190}
+
+# Outcome classes returned by classify_response
+OK = "ok"
+TRANSIENT = "transient"
+THROTTLED = "throttled"
+AUTH = "auth"
+CLIENT_ERROR = "client_error"
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling Graph while the breaker for that endpoint is open."""
+
+
+def graph_error(response):
+    """Returns the 'error' object of a Graph error response, or {} if the body has none."""
+    try:
+        body = response.json()
+    except ValueError:
+        return {}
+    error = body.get("error") if isinstance(body, dict) else None
+    return error if isinstance(error, dict) else {}
+
+
+def classify_response(response):
+    """Classifies a Graph response as ok, transient, throttled, auth or client_error."""
+    if response.ok:
+        return OK
+
+    error = graph_error(response)
+    code = error.get("code")
+    if code in THROTTLE_CODES or response.status_code == 429:
+        return THROTTLED
+    if code in AUTH_CODES or response.status_code == 401:
+        return AUTH
+    if code in TRANSIENT_CODES or error.get("is_transient") or response.status_code >= 500:
+        return TRANSIENT
+    return CLIENT_ERROR
+
+
+def is_token_error(response):
+    """True when Graph rejected the access token itself rather than a permission for this call."""
+    return graph_error(response).get("code") in TOKEN_ERROR_CODES
+
+
+def is_retryable_exception(exc):
+    """Connection failures and timeouts are worth retrying; malformed requests are not."""
+    return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def is_unsent_exception(exc):
+    """True when the connection could not be opened, so the request never reached Graph and resending it cannot duplicate it."""
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(exc, requests.exceptions.ConnectionError) and isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter for the given (0-based) retry attempt."""
+    ceiling = min(Config.GRAPH_RETRY_MAX_DELAY, Config.GRAPH_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def endpoint_key(url):
+    """Names the Graph endpoint a URL belongs to (e.g. 'insights', 'ads', 'node', 'batch') for circuit breaking."""
+    segments = [segment for segment in urlparse(url).path.split("/") if segment]
+    if segments and re.fullmatch(r"v\d+\.\d+", segments[0]):
+        segments = segments[1:]
+    if not segments:
+        return "batch"
+    edges = [segment for segment in segments[1:] if not segment.isdigit()]
+    return edges[-1] if edges else "node"
+
+
+class CircuitBreaker:
+    """Opens after repeated transient failures of one endpoint and fails fast until a cooldown has passed."""
+
+    def __init__(self, failure_threshold, cooldown):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Returns True if a call may go out: breaker closed, or half-open with no trial call running."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True  # Half-open: let one call probe whether Graph has recovered
+            return True
+
+    def release(self):
+        """Ends a half-open trial call without judging Graph's health (e.g. the request itself was invalid)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(key):
+    """Returns the circuit breaker for an endpoint key, creating it on first use."""
+    with _breakers_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(Config.GRAPH_BREAKER_THRESHOLD, Config.GRAPH_BREAKER_COOLDOWN)
+        return _breakers[key]
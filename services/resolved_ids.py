@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+import threading
+import requests
+from config import Config  # Ensure Config has PAGE_ID, PAGE_ACCESS_TOKEN and RESOLVED_IDS_PATH
+from services.graph_api import graph_get, on_auth_error
+from services.resilience import is_token_error
+
+
+class ResolveError(requests.exceptions.RequestException):
+    """Raised when an ID cannot be resolved from Graph; carries the status code and Graph's details."""
+
+    def __init__(self, message, status_code, details=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.details = details
+
+
+class ResolvedIdCache:
+    """Process-lifetime cache of IDs resolved from Graph (e.g. Page -> Instagram business account), persisted to a JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._ids = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._ids is None:
+            try:
+                with open(self.path, "r") as json_file:
+                    self._ids = json.load(json_file)
+            except (OSError, ValueError):
+                self._ids = {}
+        return self._ids
+
+    def _save(self):
+        # Best effort: the in-memory IDs stay correct, and a failed write must not break the Graph call in progress
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(self.path)}.", suffix=".tmp")
+        except OSError as e:
+            print(f"Failed to save resolved IDs: {e}")
+            return
+        try:
+            with os.fdopen(fd, "w") as json_file:
+                json.dump(self._ids, json_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Failed to save resolved IDs: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def get(self, key):
+        with self._lock:
+            return self._load().get(key)
+
+    def set(self, key, value):
+        with self._lock:
+            self._load()[key] = value
+            self._save()
+
+    def invalidate(self, key=None):
+        """Forgets one resolved ID, or all of them when no key is given."""
+        with self._lock:
+            ids = self._load()
+            if key is None:
+                if not ids:
+                    return
+                ids.clear()
+            elif ids.pop(key, None) is None:
+                return
+            self._save()
+
+
+resolved_ids = ResolvedIdCache(Config.RESOLVED_IDS_PATH)
+
+
+def instagram_account_key(page_id=None):
+    return f"instagram_business_account:{page_id or Config.PAGE_ID}"
+
+
+def get_instagram_business_account_id(page_id=None, access_token=None):
+    """Returns the Instagram business account ID linked to the Page, resolving it from Graph only on a cache miss."""
+    key = instagram_account_key(page_id)
+    instagram_business_account_id = resolved_ids.get(key)
+    if instagram_business_account_id:
+        return instagram_business_account_id
+
+    facebook_params = {"fields": "instagram_business_account", "access_token": access_token or Config.PAGE_ACCESS_TOKEN}
+    response = graph_get(page_id or Config.PAGE_ID, params=facebook_params)
+
+    if not response.ok:
+        raise ResolveError("Failed to fetch Instagram Business Account", response.status_code, response.text)
+
+    instagram_business_account_id = response.json().get('instagram_business_account', {}).get('id')
+    if not instagram_business_account_id:
+        raise ResolveError("Instagram Business Account not found", 404)
+
+    resolved_ids.set(key, instagram_business_account_id)
+    return instagram_business_account_id
+
+
+def invalidate_instagram_business_account(page_id=None):
+    """Forgets the cached Instagram business account so the next lookup resolves it again."""
+    resolved_ids.invalidate(instagram_account_key(page_id))
+
+
+@on_auth_error
+def _invalidate_on_auth_error(access_token, response):
+    # An invalid/expired Page token may mean the Page's linked accounts changed; permission errors
+    # on individual calls (codes 10, 200-299) say nothing about the linked account
+    if access_token == Config.PAGE_ACCESS_TOKEN and is_token_error(response):
+        invalidate_instagram_business_account()
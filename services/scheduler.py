@@ -0,0 +1,121 @@
+import os
+import random
+import threading
+import time
+from config import Config  # Ensure Config has the SNAPSHOT_* scheduler settings
+from services.jobs import refresh_jobs, SUCCEEDED
+
+# How often the scheduler thread checks for due snapshots
+TICK_SECONDS = 5
+
+
+class SnapshotScheduler:
+    """
+    Keeps saved snapshots warm by queueing refresh jobs before they go stale.
+
+    Each snapshot has an interval: a refresh is queued once the snapshot file is older than the interval
+    minus a random jitter (up to SNAPSHOT_REFRESH_JITTER of it), so refreshes land ahead of staleness
+    and do not all start together. The age comes from the file's mtime, so a snapshot another worker or
+    a manual refresh just wrote is not fetched again. No run is queued while the previous one is still
+    in progress. Failed runs are retried after SNAPSHOT_RETRY_INTERVAL.
+    """
+
+    def __init__(self, jobs, jitter):
+        self.jobs = jobs
+        self.jitter = jitter
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, name, path, refresh, interval):
+        """Schedules refresh(options) to keep the snapshot at path younger than interval seconds (0 disables it)."""
+        if interval <= 0:
+            return
+        with self._lock:
+            self._entries[name] = {
+                "path": path,
+                "refresh": refresh,
+                "interval": interval,
+                "job": None,
+                "next_run_at": 0.0,
+                "last_run_at": None,
+                "last_success_at": None,
+                "last_failure_at": None,
+                "last_error": None,
+            }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="snapshot-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        """Returns each scheduled snapshot's interval, current job, next run and last success/failure."""
+        now = time.time()
+        with self._lock:
+            return {
+                name: {
+                    "interval": entry["interval"],
+                    "snapshot_age": self._snapshot_age(entry["path"], now),
+                    "running_job_id": entry["job"].id if entry["job"] is not None else None,
+                    "next_run_at": entry["next_run_at"],
+                    "last_run_at": entry["last_run_at"],
+                    "last_success_at": entry["last_success_at"],
+                    "last_failure_at": entry["last_failure_at"],
+                    "last_error": entry["last_error"],
+                }
+                for name, entry in self._entries.items()
+            }
+
+    def run_pending(self):
+        """Records finished runs and queues a refresh for every snapshot that is due."""
+        now = time.time()
+        with self._lock:
+            for name, entry in self._entries.items():
+                self._collect(entry, now)
+                if entry["job"] is not None or now < entry["next_run_at"]:
+                    continue
+
+                age = self._snapshot_age(entry["path"], now)
+                refresh_at_age = entry["interval"] * (1 - self.jitter * random.random())
+                if age is not None and age < refresh_at_age:
+                    entry["next_run_at"] = now + (refresh_at_age - age)
+                    continue
+
+                entry["job"] = self.jobs.submit(name, entry["refresh"])
+                entry["last_run_at"] = now
+
+    def _collect(self, entry, now):
+        job = entry["job"]
+        if job is None or job.active:
+            return
+
+        entry["job"] = None
+        if job.status == SUCCEEDED:
+            entry["last_success_at"] = job.finished_at
+            entry["next_run_at"] = now  # The next run waits on the new snapshot's age
+        else:
+            entry["last_failure_at"] = job.finished_at
+            entry["last_error"] = job.result
+            entry["next_run_at"] = now + min(entry["interval"], Config.SNAPSHOT_RETRY_INTERVAL)
+
+    def _snapshot_age(self, path, now):
+        try:
+            return now - os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                print(f"Snapshot scheduler error: {e}")
+            self._stop.wait(TICK_SECONDS)
+
+
+snapshot_scheduler = SnapshotScheduler(refresh_jobs, Config.SNAPSHOT_REFRESH_JITTER)
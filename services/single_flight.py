@@ -0,0 +1,114 @@
+import json
+import os
+import re
+import threading
+import time
+from config import Config  # Ensure Config has REFRESH_LOCK_DIR
+
+try:
+    import fcntl
+except ImportError:  # No flock (e.g. Windows): calls are only coalesced within a worker
+    fcntl = None
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the function and the others
+    wait for it and receive the same result instead of running it again.
+
+    Within a worker the callers are coalesced on threading events. Across workers the running call
+    holds an flock on <lock_dir>/<key>.lock and writes its result next to it, so a worker that had to
+    wait for the lock returns that result rather than repeating the work. Results must therefore be
+    JSON-serializable (tuples come back as lists from another worker).
+    """
+
+    def __init__(self, lock_dir):
+        self.lock_dir = lock_dir
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def run(self, key, func):
+        """Returns func() for key, sharing one in-flight call between all concurrent callers."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_locked(key, func)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def _run_locked(self, key, func):
+        if fcntl is None or not self.lock_dir:
+            return func()
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        base_path = os.path.join(self.lock_dir, re.sub(r"[^\w.-]", "_", key))
+        with open(f"{base_path}.lock", "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker is running this call; wait for it and reuse what it produced
+                waited_since = time.time()
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                shared = self._read_result(f"{base_path}.result", waited_since)
+                if shared is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    return shared["result"]
+
+            try:
+                result = func()
+                self._write_result(f"{base_path}.result", result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_result(self, path, finished_after):
+        try:
+            with open(path, "r") as result_file:
+                shared = json.load(result_file)
+        except (OSError, ValueError):
+            return None
+        return shared if shared.get("finished_at", 0) >= finished_after else None
+
+    def _write_result(self, path, result):
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w") as result_file:
+                json.dump({"finished_at": time.time(), "result": result}, result_file)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError):
+            pass  # Other workers fall back to running the call themselves
+
+
+# Shared by the snapshot refresh endpoints; keys are "<snapshot>:<ad account>"
+refresh_flight = SingleFlight(Config.REFRESH_LOCK_DIR)
+
+
+def refresh_key(snapshot_path, ad_account_id):
+    return f"{snapshot_path}:{ad_account_id}"
@@ -0,0 +1,138 @@
+import json
+import threading
+from services.pagination import PaginationError, encode_cursor, decode_cursor, parse_limit, parse_fields
+
+# Query parameters that turn a /saved-* request into an indexed query
+QUERY_PARAMS = {"limit", "cursor", "fields", "breakdowns"}
+
+# Equality filters are passed as filter.<ad field path>=<value>, e.g. filter.campaign_id=123
+FILTER_PREFIX = "filter."
+
+# Ad fields indexed as soon as a snapshot is loaded; any other filter path is indexed on first use
+INDEXED_FIELDS = ("id", "campaign_id", "adset_id", "status")
+
+
+def _key(value):
+    """Normalizes a snapshot value to the string a query parameter would carry (numbers/bools as JSON)."""
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def resolve_path(obj, path):
+    """Returns every value at a dotted path, descending into lists (e.g. insights.publisher_platform)."""
+    values = [obj]
+    for part in path.split("."):
+        next_values = []
+        for value in values:
+            if isinstance(value, list):
+                next_values.extend(item.get(part) for item in value if isinstance(item, dict) and part in item)
+            elif isinstance(value, dict) and part in value:
+                next_values.append(value[part])
+        values = next_values
+    flattened = []
+    for value in values:
+        flattened.extend(value if isinstance(value, list) else [value])
+    return flattened
+
+
+def field_tree(fields):
+    """Turns dotted field paths into a nested dict of the keys to keep ({} marks a leaf)."""
+    tree = {}
+    for field in fields:
+        node = tree
+        for part in field.split("."):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def project(value, tree):
+    """Keeps only the fields in tree, descending into dicts and lists; leaves and non-container values stay whole."""
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: project(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+
+class SnapshotIndex:
+    """In-memory equality index over a snapshot's ads: field path -> value -> ad positions (in snapshot order)."""
+
+    def __init__(self, ads):
+        self.ads = ads
+        self._by_path = {}
+        self._lock = threading.Lock()
+        for path in INDEXED_FIELDS:
+            self._index(path)
+
+    def _index(self, path):
+        index = self._by_path.get(path)
+        if index is None:
+            index = {}
+            for position, ad in enumerate(self.ads):
+                for value in set(_key(value) for value in resolve_path(ad, path)):
+                    index.setdefault(value, []).append(position)
+            with self._lock:
+                self._by_path[path] = index
+        return index
+
+    def select(self, filters):
+        """Returns the positions of the ads matching every path=value filter, in snapshot order."""
+        if not filters:
+            return range(len(self.ads))
+        matches = sorted((self._index(path).get(value, []) for path, value in filters.items()), key=len)
+        others = [set(positions) for positions in matches[1:]]
+        return [position for position in matches[0] if all(position in other for other in others)]
+
+
+def is_snapshot_query(args):
+    """True when a /saved-* request asks for a page, projection or filter rather than the whole file."""
+    return any(key in QUERY_PARAMS or key.startswith(FILTER_PREFIX) for key in args)
+
+
+def query_snapshot(saved, args):
+    """
+    Answers a /saved-* query from the cached snapshot's index and returns (body, status_code).
+
+    limit/cursor page through the matching ads (all of them without a limit), fields= projects each
+    ad (dotted paths such as insights.spend reach into nested rows), breakdowns=1 adds the breakdown
+    insights, and filter.<path>=value is an equality filter on an ad field path. Other parameters are
+    ignored. A cursor is tied to the snapshot version it was issued for.
+    """
+    filters = {
+        key[len(FILTER_PREFIX):]: value
+        for key, value in args.items()
+        if key.startswith(FILTER_PREFIX) and len(key) > len(FILTER_PREFIX)
+    }
+    version = saved.signature[0]
+    try:
+        limit = parse_limit(args.get("limit"), default=None)
+        if not args.get("cursor"):  # An empty ?cursor= means the first page, as with /ads
+            position = {"v": version, "o": 0}
+        else:
+            position = decode_cursor(args.get("cursor"))
+            if not isinstance(position, dict) or "v" not in position or "o" not in position:
+                raise PaginationError("Invalid cursor")
+        offset = position["o"]
+        if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+            raise PaginationError("Invalid cursor")
+    except PaginationError as e:
+        return {"error": str(e)}, 400
+
+    if position.get("v") != version:
+        return {"error": "The snapshot has been refreshed since this cursor was issued; start again without a cursor"}, 409
+
+    matches = saved.index.select(filters)
+    end = len(matches) if limit is None else offset + limit
+    tree = field_tree(parse_fields(args.get("fields")) or [])
+
+    body = {
+        "ads_data": [project(saved.index.ads[match], tree) for match in matches[offset:end]],
+        "paging": {
+            "total": len(matches),
+            "next_cursor": encode_cursor({"v": version, "o": end}) if end < len(matches) else None,
+        },
+    }
+    if args.get("breakdowns"):
+        body["breakdown_insights"] = saved.data.get("breakdown_insights")
+    return body, 200
@@ -0,0 +1,227 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from flask import request, send_file
+from services.snapshot_index import SnapshotIndex, query_snapshot
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are only written when the brotli package is installed
+    brotli = None
+
+# Precompressed variants written next to each snapshot, in order of preference: (Content-Encoding, file suffix)
+SNAPSHOT_ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+_write_lock = threading.Lock()
+
+
+class CachedSnapshot:
+    """A snapshot file's parsed data (and its query index), tagged with the file's stat signature."""
+
+    def __init__(self, signature, data):
+        self.signature = signature
+        self.data = data
+        self._index = None
+
+    @property
+    def index(self):
+        """The SnapshotIndex over this snapshot's ads, built on first use."""
+        if self._index is None:
+            self._index = SnapshotIndex(self.data.get("ads_data", []))
+        return self._index
+
+
+class SnapshotCache:
+    """
+    Process-level cache of parsed snapshot files for the /saved-* queries.
+
+    A hit costs one os.stat: the entry is reused while the file's (mtime, size, inode) signature is
+    unchanged. write_snapshot replaces the file by rename, which always changes that signature, so a
+    refresh in any worker invalidates the entry; in the writing process it primes the cache directly.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Returns the CachedSnapshot for path, or None if the file does not exist."""
+        signature = _stat_signature(path)
+        if signature is None:
+            return None
+        entry = self._entries.get(path)
+        if entry is not None and entry.signature == signature:
+            return entry
+
+        with self._lock:
+            entry = self._entries.get(path)
+            signature = _stat_signature(path)
+            if entry is None or entry.signature != signature:
+                with open(path, "rb") as json_file:
+                    data = json.loads(json_file.read())
+                entry = CachedSnapshot(signature, data)
+                self._entries[path] = entry
+            return entry
+
+    def prime(self, path, data):
+        signature = _stat_signature(path)
+        if signature is not None:
+            with self._lock:
+                self._entries[path] = CachedSnapshot(signature, data)
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+
+snapshot_cache = SnapshotCache()
+
+
+def _stat_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def load_snapshot(path):
+    """Returns the parsed snapshot at path, or {} if it does not exist or cannot be read."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def meta_path(path):
+    return f"{path}.meta"
+
+
+def load_snapshot_meta(path):
+    """Returns the metadata recorded by write_snapshot (generation, sha256, size, written_at), or {}."""
+    try:
+        with open(meta_path(path), "r") as meta_file:
+            return json.load(meta_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def encode_snapshot(snapshot):
+    """Compact JSON encoding (no indentation keeps json on its C encoder)."""
+    return json.dumps(snapshot, separators=(",", ":")).encode("utf-8")
+
+
+def compress_snapshot(body):
+    """Returns {Content-Encoding: compressed body} for every precompressed variant available."""
+    variants = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body)
+    return variants
+
+
+def write_snapshot(path, snapshot):
+    """
+    Atomically replaces the snapshot at path and returns its new metadata.
+
+    The compact encoding is written to a temp file in the same directory, fsynced and renamed over
+    path, so readers see either the previous or the new snapshot and never a partial one. Gzip (and
+    brotli, if installed) variants are then written the same way to <path>.gz / <path>.br, after the
+    snapshot so a variant is never newer-looking than stale. The content hash and a generation number
+    (one more than the previous write) go to <path>.meta.
+    """
+    body = encode_snapshot(snapshot)
+    variants = compress_snapshot(body)
+    with _write_lock:
+        _atomic_write(path, body)
+        for encoding, suffix in SNAPSHOT_ENCODINGS:
+            if encoding in variants:
+                _atomic_write(f"{path}{suffix}", variants[encoding])
+        meta = {
+            "generation": load_snapshot_meta(path).get("generation", 0) + 1,
+            "sha256": hashlib.sha256(body).hexdigest(),
+            "size": len(body),
+            "encodings": {encoding: len(variant) for encoding, variant in variants.items()},
+            "written_at": time.time(),
+        }
+        _atomic_write(meta_path(path), json.dumps(meta).encode("utf-8"))
+        snapshot_cache.prime(path, snapshot)
+    return meta
+
+
+def send_snapshot(path):
+    """
+    Sends the snapshot file's bytes as they are on disk (sendfile where the server supports it), or returns None if it is missing.
+
+    A precompressed variant is chosen from Accept-Encoding when one at least as new as the snapshot
+    exists. Responses carry Content-Length, ETag and Last-Modified and answer conditional requests with 304.
+    """
+    try:
+        snapshot_mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    file_path, content_encoding = path, None
+    for encoding, suffix in SNAPSHOT_ENCODINGS:
+        if request.accept_encodings[encoding] <= 0:
+            continue
+        try:
+            if os.stat(f"{path}{suffix}").st_mtime_ns >= snapshot_mtime:
+                file_path, content_encoding = f"{path}{suffix}", encoding
+                break
+        except OSError:
+            continue
+
+    response = send_file(
+        os.path.abspath(file_path),
+        mimetype="application/json",
+        download_name=os.path.basename(path),
+        conditional=True,
+        etag=True,
+    )
+    if content_encoding:
+        response.headers["Content-Encoding"] = content_encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def query_saved_snapshot(path, args):
+    """Answers a filtered/paginated/projected /saved-* query from the in-memory snapshot index; returns (body, status_code)."""
+    saved = snapshot_cache.get(path)
+    if saved is None:
+        return {"error": "No saved data found"}, 404
+    return query_snapshot(saved, args)
+
+
+def _atomic_write(path, body):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(body)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.chmod(tmp_path, 0o644)  # mkstemp creates the file owner-only
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    if hasattr(os, "O_DIRECTORY"):  # Persist the rename itself (POSIX only)
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
@@ -0,0 +1,117 @@
+import threading
+import time
+import requests
+from config import Config  # Ensure Config has PAGE_ID, PAGE_ACCESS_TOKEN and the PAGE_TOKEN_* settings
+from services.graph_api import graph_get, on_auth_error
+from services.resilience import is_token_error
+
+
+class TokenError(requests.exceptions.RequestException):
+    """Raised when the Page Access Token cannot be retrieved; carries Graph's status code and details."""
+
+    def __init__(self, message, status_code, details=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.details = details
+
+
+class PageTokenCache:
+    """
+    Caches the Page Access Token exchanged from Config.PAGE_ACCESS_TOKEN together with its expiry.
+
+    The expiry comes from /debug_token, or PAGE_TOKEN_TTL when Graph reports none. Within
+    PAGE_TOKEN_REFRESH_MARGIN of expiring the token is refreshed on a background thread while the
+    current one keeps being served. A token error (invalid/expired) for the cached token invalidates it.
+    """
+
+    def __init__(self):
+        self.token = None
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self):
+        """Returns a valid Page Access Token, fetching one from Graph only when none is cached."""
+        token = self._cached_token()
+        if token:
+            return token
+
+        # Concurrent requests on a cold or invalidated cache share one exchange instead of each calling Graph
+        with self._refresh_lock:
+            token = self._cached_token()
+            if token:
+                return token
+            return self.refresh()
+
+    def _cached_token(self):
+        """Returns the cached token while it is valid (starting a background refresh near expiry), else None."""
+        with self._lock:
+            now = time.time()
+            if self.token and now < self.expires_at:
+                if now >= self.expires_at - Config.PAGE_TOKEN_REFRESH_MARGIN and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._background_refresh, name="page-token-refresh", daemon=True).start()
+                return self.token
+        return None
+
+    def refresh(self):
+        """Exchanges the configured token for a fresh Page Access Token and caches it with its expiry."""
+        token_params = {"fields": "access_token", "access_token": Config.PAGE_ACCESS_TOKEN}
+        token_response = graph_get(Config.PAGE_ID, params=token_params)
+
+        if not token_response.ok:
+            raise TokenError("Failed to retrieve Page Access Token", token_response.status_code, token_response.text)
+
+        page_access_token = token_response.json().get("access_token")
+        if not page_access_token:
+            raise TokenError("Failed to retrieve Page Access Token", 403)
+
+        expires_at = self._token_expiry(page_access_token)
+        with self._lock:
+            self.token = page_access_token
+            self.expires_at = expires_at
+        return page_access_token
+
+    def invalidate(self, access_token=None):
+        """Drops the cached token (only if it is access_token, when one is given)."""
+        with self._lock:
+            if access_token is None or access_token == self.token:
+                self.token = None
+                self.expires_at = 0.0
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except requests.exceptions.RequestException as e:
+            print(f"Background Page Access Token refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _token_expiry(self, page_access_token):
+        """Returns the token's expiry timestamp from /debug_token, capped at PAGE_TOKEN_TTL from now."""
+        ttl_expiry = time.time() + Config.PAGE_TOKEN_TTL
+        try:
+            debug_response = graph_get("debug_token", params={
+                "input_token": page_access_token,
+                "access_token": Config.PAGE_ACCESS_TOKEN,
+            })
+        except requests.exceptions.RequestException:
+            return ttl_expiry
+
+        if not debug_response.ok:
+            return ttl_expiry
+
+        expires_at = debug_response.json().get("data", {}).get("expires_at") or 0
+        return min(expires_at, ttl_expiry) if expires_at > 0 else ttl_expiry  # expires_at 0 means never expires
+
+
+page_token_cache = PageTokenCache()
+
+
+@on_auth_error
+def _invalidate_on_auth_error(access_token, response):
+    # Permission errors (codes 10, 200-299) leave the token valid, e.g. fetch_cover's expanded fields being rejected
+    if is_token_error(response):
+        page_token_cache.invalidate(access_token)